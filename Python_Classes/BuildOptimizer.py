@@ -0,0 +1,265 @@
+"""
+Offline search for the best builds the catalog allows, per role/enemy pair.
+
+    python BuildOptimizer.py                  # all 12 pairs, top 16 each
+    python BuildOptimizer.py --top-k 24 --pairs "Saboteur_automatons"
+
+For every pair, a branch-and-bound search walks primary -> secondary ->
+grenade -> support weapon -> 3 other stratagems -> armor, scoring each item by
+its effectiveness against the enemy plus a role-affinity bonus. Only builds
+that pass check_loadout_needs_fix (1 support, <=1 backpack, 4 distinct
+stratagems, hazard-armor rule) are kept. The index holds K builds per pair that
+each change at least MIN_ITEM_CHANGES items versus the others, best first, and
+is written to json/helldivers_build_index.json. The API draws from it at runtime
+(see draw_indexed_build) without any search.
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+from CatalogStore import Catalog, load_catalog_file, CATALOG_FILE
+from utils import is_support, is_backpack, check_loadout_needs_fix
+
+INDEX_FILE = "../json/helldivers_build_index.json"
+ROLES = ["Crowd Control", "Anti-Tank", "Saboteur", "Stratagem Support"]
+ENEMIES = ["automatons", "terminids", "illuminate"]
+HAZARD_TYPES = ["Toxic Gas", "Fire", "ARC"]
+GEAR_SLOTS = [("primary", "primaries"), ("secondary", "secondaries"),
+              ("grenade", "grenades"), ("armor_passive", "armor_passives")]
+TOP_K = 16
+# Same rule as the runtime novelty check: indexed builds differ pairwise by >= 3 items.
+MIN_ITEM_CHANGES = 3
+BUILD_SIZE = 8
+# Effectiveness scores run 1-10; an on-role item is worth this much extra.
+ROLE_AFFINITY_WEIGHT = 3.0
+ROLE_KEYWORDS = {
+    "Crowd Control": ["crowd control", "crowd-control", "swarm", "horde", "hord", "stun", "area denial",
+                      "suppress", "chaff", "crowd"],
+    "Anti-Tank": ["anti-tank", "anti-armor", "anti armor", "heavy armor", "heavily armored", "tank", "elite"],
+    "Saboteur": ["saboteur", "demolition", "structure", "nest", "hive", "fabricator", "objective", "precision explosive"],
+    "Stratagem Support": ["stratagem support", "support", "utility", "sentry", "shield", "resupply", "healing"],
+}
+
+# -------------------- Scoring --------------------
+
+def role_affinity(raw_item, role) -> float:
+    """1.0 if the item's role/goal text matches the role, else 0.0."""
+    text = " ".join(str(raw_item.get(f, "")) for f in ("squad_role", "Role", "Goal")).lower()
+    return 1.0 if any(word in text for word in ROLE_KEYWORDS.get(role, [role.lower()])) else 0.0
+
+
+def _candidates(catalog, role, enemy):
+    """Scored candidates per slot with their build value, best first."""
+    raw = {i.get("Name") or i.get("name"): i for i in catalog.data["loadout"] + catalog.data["stratagems"]}
+    pool = catalog.scored_pool(enemy)
+    for items in pool.values():
+        for item in items:
+            item["value"] = item["score"] + ROLE_AFFINITY_WEIGHT * role_affinity(raw.get(item["name"], {}), role)
+        items.sort(key=lambda i: (-i["value"], i["name"]))
+    return pool
+
+# -------------------- Branch and bound --------------------
+
+def _best_diverse_build(pool, chosen):
+    """
+    Highest-value valid build sharing at most BUILD_SIZE - MIN_ITEM_CHANGES items
+    with every build in `chosen` (sets of names). Returns (value, gear, strats) or None.
+    """
+    max_shared = BUILD_SIZE - MIN_ITEM_CHANGES
+    gear_lists = [pool["primaries"], pool["secondaries"], pool["grenades"]]
+    supports = [s for s in pool["stratagems"] if is_support(s)]
+    others = [s for s in pool["stratagems"] if not is_support(s)]
+    armors = pool["armor_passives"]
+    if not all(gear_lists) or not supports or len(others) < 3 or not armors:
+        return None
+
+    # Optimistic value of everything still to pick after each gear slot
+    best_armor = armors[0]["value"]
+    best_strats = supports[0]["value"] + sum(s["value"] for s in others[:3])
+    gear_rest = [0.0] * 4
+    for i in range(2, -1, -1):
+        gear_rest[i] = gear_rest[i + 1] + gear_lists[i][0]["value"]
+    # others_rest[j][m]: best m values among others[j:], which are sorted
+    others_rest = [[sum(s["value"] for s in others[j:j + m]) if j + m <= len(others) else float("-inf")
+                    for m in range(4)] for j in range(len(others) + 1)]
+
+    best = {"value": float("-inf"), "build": None}
+
+    def shared_ok(shared):
+        return all(n <= max_shared for n in shared)
+
+    def with_item(shared, name):
+        return tuple(n + (name in c) for n, c in zip(shared, chosen))
+
+    def finish(value, gear, strats, shared):
+        # Whether an armor passes the hazard rule depends only on its hazard type,
+        # so check one armor per type rather than every armor.
+        valid_by_type = {}
+        for armor in armors:
+            total = value + armor["value"]
+            if total <= best["value"]:
+                return  # armors are sorted; nothing later can win
+            armor_type = armor.get("Damage Type") if armor.get("Damage Type") in HAZARD_TYPES else None
+            if armor_type not in valid_by_type:
+                loadout = {"loadout": dict(zip(("primary", "secondary", "grenade", "armor_passive"), gear + [armor])),
+                           "stratagems": strats}
+                valid_by_type[armor_type] = not check_loadout_needs_fix(loadout)
+            if valid_by_type[armor_type] and shared_ok(with_item(shared, armor["name"])):
+                best["value"], best["build"] = total, (gear + [armor], list(strats))
+                return
+
+    def pick_others(value, gear, strats, start, backpacks, shared):
+        m = 4 - len(strats)
+        if m == 0:
+            finish(value, gear, strats, shared)
+            return
+        for j in range(start, len(others) - m + 1):
+            if value + others_rest[j][m] + best_armor <= best["value"]:
+                return  # later j only lowers the bound
+            s = others[j]
+            if is_backpack(s) and backpacks:
+                continue
+            new_shared = with_item(shared, s["name"])
+            if not shared_ok(new_shared):
+                continue
+            pick_others(value + s["value"], gear, strats + [s], j + 1, backpacks + is_backpack(s), new_shared)
+
+    def pick_gear(depth, value, gear, shared):
+        if depth == 3:
+            for s in supports:
+                if value + s["value"] + others_rest[0][3] + best_armor <= best["value"]:
+                    return
+                new_shared = with_item(shared, s["name"])
+                if shared_ok(new_shared):
+                    pick_others(value + s["value"], gear, [s], 0, int(is_backpack(s)), new_shared)
+            return
+        for item in gear_lists[depth]:
+            if value + item["value"] + gear_rest[depth + 1] + best_strats + best_armor <= best["value"]:
+                return
+            new_shared = with_item(shared, item["name"])
+            if shared_ok(new_shared):
+                pick_gear(depth + 1, value + item["value"], gear + [item], new_shared)
+
+    pick_gear(0, 0.0, [], tuple(0 for _ in chosen))
+    if best["build"] is None:
+        return None
+    gear, strats = best["build"]
+    return best["value"], gear, strats
+
+
+def optimize_pair(catalog, role, enemy, top_k=TOP_K) -> list:
+    """Up to `top_k` mutually diverse builds, best first, as {"value", "items"} entries."""
+    pool = _candidates(catalog, role, enemy)
+    chosen, entries = [], []
+    while len(entries) < top_k:
+        found = _best_diverse_build(pool, chosen)
+        if found is None:
+            break
+        value, gear, strats = found
+        names = [g["name"] for g in gear] + [s["name"] for s in strats]
+        chosen.append(set(names))
+        entries.append({"value": round(value, 2), "items": names})
+    return entries
+
+# -------------------- Runtime lookup --------------------
+
+_index = {"sig": None, "data": {}}
+_version_warned = set()
+
+
+def load_build_index() -> dict:
+    """The index file, re-read only when it changes on disk; {} if missing or unreadable."""
+    try:
+        st = os.stat(INDEX_FILE)
+    except FileNotFoundError:
+        _index["sig"], _index["data"] = None, {}
+        return {}
+    sig = (st.st_mtime_ns, st.st_size)
+    if sig != _index["sig"]:
+        try:
+            with open(INDEX_FILE, "r", encoding="utf-8") as f:
+                _index["data"] = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[INDEX] Could not read {INDEX_FILE}: {e}")
+            _index["data"] = {}
+        _index["sig"] = sig
+    return _index["data"]
+
+
+def draw_indexed_build(key, catalog, enemy, is_novel=None, tries=3):
+    """
+    A random build from the pair's top-K entries, rebuilt from the catalog's
+    scored items (so it plugs into validation and flavor text like any pool
+    pick). With `is_novel`, up to `tries` draws are made to find one that
+    passes it. Returns None when the pair is not indexed, or the index was
+    built from another catalog version than `catalog` (a Catalog; raw dicts
+    have no comparable version and skip the index).
+    """
+    if not isinstance(catalog, Catalog):
+        return None
+    index = load_build_index()
+    entries = index.get("pairs", {}).get(key)
+    if not entries:
+        return None
+    if index.get("catalog_version") != catalog.version:
+        versions = (index.get("catalog_version"), catalog.version)
+        if versions not in _version_warned:
+            _version_warned.add(versions)
+            print(f"[INDEX] Built from catalog {versions[0]}, current is {versions[1]}: "
+                  f"not used until BuildOptimizer.py is re-run")
+        return None
+    for _ in range(tries):
+        names = random.choice(entries)["items"]
+        items = [catalog.scored_item(name, enemy) for name in names]
+        if None in items or len(items) != BUILD_SIZE:
+            continue
+        build = {"loadout": {slot: item for (slot, _), item in zip(GEAR_SLOTS, items)},
+                 "stratagems": items[len(GEAR_SLOTS):]}
+        if is_novel is None or is_novel(build):
+            return build
+    return None
+
+# -------------------- CLI --------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the top-K build index per role/enemy pair.")
+    parser.add_argument("--top-k", type=int, default=TOP_K, help="Builds kept per pair (default %(default)s)")
+    parser.add_argument("--pairs", help="Comma-separated Role_enemy keys (default: all 12)")
+    parser.add_argument("--output", default=INDEX_FILE, help="Index file (default %(default)s)")
+    args = parser.parse_args()
+
+    catalog = load_catalog_file(CATALOG_FILE)
+    if args.pairs:
+        pairs = [tuple(key.strip().rsplit("_", 1)) for key in args.pairs.split(",")]
+        for role, enemy in pairs:
+            if role not in ROLES or enemy not in ENEMIES:
+                raise SystemExit(f"Unknown pair: {role}_{enemy}")
+    else:
+        pairs = [(role, enemy) for role in ROLES for enemy in ENEMIES]
+
+    index = {"pairs": {}}
+    if os.path.exists(args.output):
+        with open(args.output, "r", encoding="utf-8") as f:
+            index = json.load(f)  # keep pairs we are not rebuilding
+
+    for role, enemy in pairs:
+        started = time.perf_counter()
+        entries = optimize_pair(catalog, role, enemy, args.top_k)
+        index["pairs"][f"{role}_{enemy}"] = entries
+        best = entries[0]["value"] if entries else None
+        print(f"{role + '_' + enemy:<32} {len(entries):>3} builds  best={best}  "
+              f"{time.perf_counter() - started:.2f}s")
+
+    index.update({"catalog_version": catalog.version, "top_k": args.top_k, "generated_at": time.time()})
+    directory = os.path.dirname(os.path.abspath(args.output))
+    tmp_path = os.path.join(directory, ".build_index.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, separators=(",", ":"))
+    os.replace(tmp_path, args.output)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
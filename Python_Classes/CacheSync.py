@@ -0,0 +1,272 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl  # POSIX only
+except ImportError:
+    fcntl = None
+
+from utils import load_json, _coerce_to_loadout
+
+CACHE_FILE = "../json/helldivers_cached_loadouts.json"
+VERSION_FILE = "../json/helldivers_cache_versions.bin"
+HISTORY_FILE = "../json/helldivers_loadout_history.json"
+LOCK_DIR = "../json/.locks"
+ROLES = ["Crowd Control", "Anti-Tank", "Saboteur", "Stratagem Support"]
+ENEMIES = ["automatons", "terminids", "illuminate"]
+
+# Slot 0 is the cache version, slots 1..12 are per "Role_Enemy" request
+# counters for the refresh scheduler.
+KEYS = [f"{role}_{enemy}" for role in ROLES for enemy in ENEMIES]
+_SLOT = struct.Struct("<Q")
+_DEMAND_BASE = 1
+_TABLE_SIZE = _SLOT.size * (_DEMAND_BASE + len(KEYS))
+
+# -------------------- Cross-process file locks --------------------
+
+# Fallback for platforms without fcntl: locks only hold inside one process,
+# which is fine for a single uvicorn worker.
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+def _lock_path(name: str) -> str:
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    return os.path.join(LOCK_DIR, f"{name}.lock")
+
+
+@contextmanager
+def _file_lock(name: str, blocking=True):
+    """
+    Holds an exclusive flock on ../json/.locks/<name>.lock.
+    Yields True if the lock was acquired, False otherwise (non-blocking only).
+    The OS drops the lock if the holding worker dies, so it doubles as a lease.
+    """
+    if fcntl is None:
+        with _local_locks_guard:
+            lock = _local_locks.setdefault(name, threading.Lock())
+        acquired = lock.acquire(blocking)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                lock.release()
+        return
+
+    fd = os.open(_lock_path(name), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(fd, flags)
+            acquired = True
+        except BlockingIOError:
+            acquired = False
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+_held_locks = {}
+
+
+def hold_lock(name: str) -> bool:
+    """
+    Non-blocking acquire of a lock this process keeps until it exits,
+    e.g. to elect the single worker that runs the refresh scheduler.
+    """
+    if name in _held_locks:
+        return True
+    if fcntl is None:
+        with _local_locks_guard:
+            lock = _local_locks.setdefault(name, threading.Lock())
+        if lock.acquire(False):
+            _held_locks[name] = lock
+            return True
+        return False
+
+    fd = os.open(_lock_path(name), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return False
+    _held_locks[name] = fd
+    return True
+
+
+@contextmanager
+def refresh_lease(key: str):
+    """
+    Elects a single refresher for `key` across all workers.
+    Yields True for the winner; everyone else gets False and should skip.
+    """
+    with _file_lock(f"refresh_{key}", blocking=False) as acquired:
+        yield acquired
+
+# -------------------- Shared version table --------------------
+
+_table = None
+_table_guard = threading.Lock()
+
+
+def _version_table():
+    """Maps the shared version file once per process, creating it if needed."""
+    global _table
+    if _table is not None:
+        return _table
+    with _table_guard:
+        if _table is None:
+            with _file_lock("versions"):
+                fd = os.open(VERSION_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    if os.fstat(fd).st_size < _TABLE_SIZE:
+                        os.ftruncate(fd, _TABLE_SIZE)
+                    _table = mmap.mmap(fd, _TABLE_SIZE)
+                finally:
+                    os.close(fd)
+    return _table
+
+
+def get_version() -> int:
+    """Current version of the cache file; every write bumps it."""
+    return _SLOT.unpack_from(_version_table(), 0)[0]
+
+
+def _bump_version():
+    # Caller must hold the "cache" file lock.
+    table = _version_table()
+    _SLOT.pack_into(table, 0, _SLOT.unpack_from(table, 0)[0] + 1)
+
+
+def record_demand(key: str):
+    """
+    Counts one user request for `key` in the shared table.
+    Unlocked increment: two workers racing may lose a count, which is fine for a demand signal.
+    """
+    if key not in KEYS:
+        return
+    table = _version_table()
+    offset = _SLOT.size * (_DEMAND_BASE + KEYS.index(key))
+    _SLOT.pack_into(table, offset, _SLOT.unpack_from(table, offset)[0] + 1)
+
+
+def get_demand_counts() -> dict:
+    """Monotonic request counters per key, summed over all workers."""
+    table = _version_table()
+    return {key: _SLOT.unpack_from(table, _SLOT.size * (_DEMAND_BASE + i))[0]
+            for i, key in enumerate(KEYS)}
+
+# -------------------- Cache reads & writes --------------------
+
+_snapshot = {"version": None, "data": {}}
+_snapshot_guard = threading.Lock()
+
+
+def load_cache_snapshot() -> dict:
+    """
+    Returns this worker's in-memory copy of the cache, re-reading the file
+    only when another worker (or this one) has published a newer version.
+    Treat the returned dict as read-only.
+    """
+    version = get_version()
+    if _snapshot["version"] == version:
+        return _snapshot["data"]
+    with _snapshot_guard:
+        if _snapshot["version"] != version:
+            _snapshot["data"] = load_json(CACHE_FILE)
+            _snapshot["version"] = version
+    return _snapshot["data"]
+
+
+def _write_atomic(data, path=None):
+    path = path or CACHE_FILE
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        # mkstemp creates 0600 and os.replace keeps it; keep the file's old mode instead
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def save_cache_entry(key: str, value):
+    """
+    Read-modify-write of a single cache key under the cross-process cache lock,
+    so concurrent refreshes of different keys never clobber each other.
+    """
+    with _file_lock("cache"):
+        cache = load_json(CACHE_FILE)
+        cache[key] = value
+        _write_atomic(cache)
+        _bump_version()
+    return cache
+
+
+def save_cache_entries(entries: dict):
+    """Like save_cache_entry for several keys at once: one lock, one read, one write."""
+    with _file_lock("cache"):
+        cache = load_json(CACHE_FILE)
+        cache.update(entries)
+        _write_atomic(cache)
+        _bump_version()
+    return cache
+
+
+def mark_cache_entries_stale(keys):
+    """
+    Flags `keys` with "stale": true and clears their updated_at. Readers keep
+    serving the entry; the refresh scheduler ranks it first.
+    """
+    with _file_lock("cache"):
+        cache = load_json(CACHE_FILE)
+        marked = []
+        for key in keys:
+            entry = _coerce_to_loadout(cache.get(key))
+            if entry:
+                entry["stale"] = True
+                entry.pop("updated_at", None)
+                marked.append(key)
+        if marked:
+            _write_atomic(cache)
+            _bump_version()
+    return marked
+
+
+def save_cache_all(cache: dict):
+    """Replaces the whole cache file and invalidates every worker's copy."""
+    with _file_lock("cache"):
+        _write_atomic(cache)
+        _bump_version()
+
+# -------------------- Per-key build history --------------------
+
+def load_history(key: str) -> list:
+    """Item-name lists of the last builds saved for `key`, oldest first."""
+    return load_json(HISTORY_FILE).get(key, [])
+
+
+def append_history(key: str, item_names: list, window: int):
+    """Pushes a build onto the key's history ring, keeping only the last `window`."""
+    with _file_lock("history"):
+        history = load_json(HISTORY_FILE)
+        ring = history.get(key, []) + [item_names]
+        history[key] = ring[-window:]
+        _write_atomic(history, HISTORY_FILE)
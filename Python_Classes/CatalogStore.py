@@ -0,0 +1,254 @@
+import hashlib
+import json
+import os
+import threading
+
+from utils import get_average_effectiveness
+
+CATALOG_FILE = "../json/helldivers_complete.json"
+ENEMIES = ["automatons", "terminids", "illuminate"]
+# Pool key -> catalog "Type" for the four gear slots
+GEAR_CATEGORIES = {
+    "primaries": "Primary",
+    "secondaries": "Secondary",
+    "grenades": "Throwable",
+    "armor_passives": "Armor Passives",
+}
+# How often each worker stats the catalog file for changes.
+CATALOG_POLL_S = float(os.getenv("DROPZONE_CATALOG_POLL_S", "5"))
+
+
+class CatalogError(ValueError):
+    pass
+
+# -------------------- Scoring (pool candidates) --------------------
+
+def score_category(data, category, enemy_type=None) -> list:
+    """Every gear item of `category` with its effectiveness score against `enemy_type`."""
+    pool = []
+    for item in data.get("loadout", []):
+        if item.get("Type") == category:
+            if enemy_type:
+                score = float(item.get(f"{enemy_type.lower()}_effectiveness", 0))
+            else:
+                score = get_average_effectiveness(item)
+            pool.append({
+                "name": item["Name"],
+                "score": score,
+                "Type": item.get("Type", ""),
+                "Damage Type": item.get("Damage Type", ""),
+                "special_traits": item.get("special_traits", ""),
+                "goal": item.get("Goal", "")
+            })
+    return pool
+
+
+def score_stratagems(data, enemy_type=None) -> list:
+    pool = []
+    for item in data.get("stratagems", []):
+        if enemy_type:
+            score = float(item.get(f"{enemy_type.lower()}_effectiveness", 0))
+        else:
+            score = get_average_effectiveness(item)
+        pool.append({
+            "name": item["name"],
+            "score": score,
+            "category": item.get("category", ""),
+            "Damage Type": item.get("Damage Type", ""),
+            "squad_role": item.get("squad_role", ""),
+            "is_backpack": item.get("BackPack", "No") == "Yes",
+            "is_disposable": item.get("Disposable", "No") == "Yes",
+            "special_traits": item.get("special_traits", ""),
+            "goal": item.get("Goal", "")
+        })
+    return pool
+
+
+def score_pool(data, enemy_type=None) -> dict:
+    """All scored candidates per pool key, before any random sampling."""
+    pool = {key: score_category(data, category, enemy_type) for key, category in GEAR_CATEGORIES.items()}
+    pool["stratagems"] = score_stratagems(data, enemy_type)
+    return pool
+
+# -------------------- Validation --------------------
+
+def validate_catalog(data):
+    """Raises CatalogError if `data` cannot back the pipeline."""
+    if not isinstance(data, dict):
+        raise CatalogError("top level must be an object")
+    for section, name_field in (("loadout", "Name"), ("stratagems", "name")):
+        items = data.get(section)
+        if not isinstance(items, list) or not items:
+            raise CatalogError(f"'{section}' must be a non-empty list")
+        seen = set()
+        for i, item in enumerate(items):
+            if not isinstance(item, dict) or not item.get(name_field):
+                raise CatalogError(f"{section}[{i}] has no '{name_field}'")
+            if item[name_field] in seen:
+                raise CatalogError(f"duplicate {section} entry {item[name_field]!r}")
+            seen.add(item[name_field])
+            for enemy in ENEMIES:
+                value = item.get(f"{enemy}_effectiveness", 0)
+                try:
+                    float(value)
+                except (TypeError, ValueError):
+                    raise CatalogError(f"{item[name_field]!r}: {enemy}_effectiveness is not a number")
+
+    types = {item.get("Type") for item in data["loadout"]}
+    missing = [c for c in GEAR_CATEGORIES.values() if c not in types]
+    if missing:
+        raise CatalogError(f"no gear of type {missing}")
+    if not any(s.get("category") == "Support Weapons" and s.get("Disposable", "No") != "Yes"
+               for s in data["stratagems"]):
+        raise CatalogError("no non-disposable support weapon stratagem")
+
+# -------------------- Immutable catalog snapshot --------------------
+
+def _digest(raw: bytes) -> str:
+    return hashlib.sha1(raw).hexdigest()[:12]
+
+
+class Catalog:
+    """
+    One parsed catalog plus everything derived from it: item bit positions for
+    novelty checks, a fingerprint per item, and the scored pool candidates per
+    enemy. Never mutated after construction, so a request that grabbed an
+    instance keeps a consistent view even if a reload swaps in a newer one.
+    """
+
+    def __init__(self, data, version=None):
+        self.data = data
+        self.version = version or _digest(json.dumps(data, sort_keys=True).encode("utf-8"))
+        names = [i["Name"] for i in data.get("loadout", [])]
+        names += [s["name"] for s in data.get("stratagems", [])]
+        self.bit_ids = {name: bit for bit, name in enumerate(dict.fromkeys(names))}
+        self.fingerprints = {
+            item.get("Name") or item.get("name"): _digest(json.dumps(item, sort_keys=True).encode("utf-8"))
+            for item in data.get("loadout", []) + data.get("stratagems", [])
+        }
+        self._scored = {enemy: score_pool(data, enemy) for enemy in [None] + ENEMIES}
+        self._by_name = {enemy: {item["name"]: item for items in scored.values() for item in items}
+                         for enemy, scored in self._scored.items()}
+
+    def scored_pool(self, enemy_type=None) -> dict:
+        """A private copy of the scored candidates, safe for the sampler to consume."""
+        scored = self._scored.get(enemy_type)
+        if scored is None:
+            scored = score_pool(self.data, enemy_type)
+        return {key: [dict(item) for item in items] for key, items in scored.items()}
+
+    def scored_item(self, name, enemy_type=None):
+        """One scored candidate by name (a private copy), or None if the catalog lacks it."""
+        item = self._by_name.get(enemy_type, {}).get(name)
+        return dict(item) if item else None
+
+    def changed_items(self, older: "Catalog") -> set:
+        """Names of items that `older` has and this catalog changed or removed."""
+        return {name for name, fp in older.fingerprints.items() if self.fingerprints.get(name) != fp}
+
+
+def load_catalog_file(path=CATALOG_FILE) -> Catalog:
+    """Reads, parses (once) and validates the catalog file."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    data = json.loads(raw)
+    validate_catalog(data)
+    return Catalog(data, _digest(raw))
+
+# -------------------- Hot reload --------------------
+
+class CatalogStore:
+    """
+    Holds the current Catalog and swaps it when the file changes on disk.
+
+    A background thread stats the file every `poll_s`; when its mtime or size
+    moves, the new file is parsed and validated on that thread, and only then
+    is the reference swapped. A file that fails validation (or is caught half
+    written) is logged and the previous catalog stays live. After a swap,
+    `on_change(old, new, changed_names)` gets the names of items that changed
+    or were removed, so the caller can invalidate what depends on them.
+    """
+
+    def __init__(self, path=CATALOG_FILE, on_change=None, poll_s=CATALOG_POLL_S):
+        self.path = path
+        self.on_change = on_change
+        self.poll_s = poll_s
+        self._current = None
+        self._file_sig = None
+        self._lock = threading.Lock()
+        self._stats = {"reloads": 0, "rejected": 0, "last_error": None, "invalidated": []}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def current(self):
+        """The live Catalog, or None if no valid catalog has been loaded yet."""
+        if self._current is None:
+            self.reload_if_changed()
+        return self._current
+
+    def reload_if_changed(self) -> bool:
+        """Returns True if a new catalog was swapped in."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        sig = (st.st_mtime_ns, st.st_size)
+        if sig == self._file_sig:
+            return False
+
+        with self._lock:
+            if sig == self._file_sig:
+                return False
+            old = self._current
+            try:
+                new = load_catalog_file(self.path)
+            except (OSError, ValueError) as e:
+                # Remember the bad file so it is not re-parsed every tick; the next write retries
+                self._file_sig = sig
+                self._stats["rejected"] += 1
+                self._stats["last_error"] = str(e)
+                print(f"[CATALOG] Rejected {self.path}: {e}; "
+                      f"keeping {'version ' + old.version if old else 'no catalog'}")
+                return False
+            self._file_sig = sig
+            if old is not None and new.version == old.version:
+                return False
+            self._current = new
+            self._stats["reloads"] += 1
+            self._stats["last_error"] = None
+
+        if old is None:
+            print(f"[CATALOG] Loaded version {new.version}")
+            return True
+        changed = new.changed_items(old)
+        print(f"[CATALOG] Swapped {old.version} -> {new.version} ({len(changed)} item(s) changed or removed)")
+        if changed and self.on_change:
+            try:
+                self._stats["invalidated"] = self.on_change(old, new, changed) or []
+            except Exception as e:
+                print(f"[CATALOG] on_change failed: {e}")
+        return True
+
+    def _loop(self):
+        while not self._stop.wait(self.poll_s):
+            self.reload_if_changed()
+
+    def start(self):
+        self.current()
+        if self._thread is None and self.poll_s > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="catalog-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def status(self) -> dict:
+        return {
+            **self._stats,
+            "version": self._current.version if self._current else None,
+            "poll_s": self.poll_s,
+        }
@@ -1,21 +1,58 @@
 import json
 import random
-from OpenAIRequest import generate_helldivers_loadout, rewrite_flavor_text
+from OpenAIRequest import (
+    generate_helldivers_loadout, generate_helldivers_loadouts_batch, rewrite_flavor_text, stream_flavor_text,
+    track_usage,
+)
 import os
 import re
 from copy import deepcopy
 
-from collections import Counter
+from contextlib import ExitStack, contextmanager, nullcontext
+import contextvars
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from utils import(
-    load_json, save_cache, calculate_weight, weighted_choice,
-    get_average_effectiveness,  _coerce_to_loadout, unique_candidates
+    load_json, calculate_weight, weighted_choice,
+    _coerce_to_loadout, unique_candidates,
+    is_support, is_backpack, check_loadout_needs_fix
+)
+from CacheSync import (
+    load_cache_snapshot, refresh_lease, save_cache_entry, save_cache_entries, load_history,
+    append_history, mark_cache_entries_stale
 )
+from CatalogStore import Catalog, score_category, score_stratagems, score_pool
+from BuildOptimizer import draw_indexed_build, GEAR_SLOTS
 CACHE_FILE = "../json/helldivers_cached_loadouts.json"
 BACKUP_FILE = "../json/Helldivers_Backup_Classes.json"
 ROLES = ["Crowd Control", "Anti-Tank", "Saboteur", "Stratagem Support"]
 ENEMIES = ["automatons", "terminids", "illuminate"]
 
+# Speculative rerolls: K parallel selection calls, at most MAX_CALLS per refresh.
+# K <= 1 keeps the original one-at-a-time rerolls.
+SPECULATIVE_K = int(os.getenv("DROPZONE_SPECULATIVE_K", "1"))
+SPECULATIVE_MAX_CALLS = int(os.getenv("DROPZONE_SPECULATIVE_MAX_CALLS", "6"))
+
+# A new build must change at least MIN_ITEM_CHANGES items versus each of the
+# last NOVELTY_WINDOW builds for its pair.
+MIN_ITEM_CHANGES = 3
+NOVELTY_WINDOW = int(os.getenv("DROPZONE_NOVELTY_WINDOW", "8"))
+
+_reroll_metrics = {
+    "speculative_runs": 0,
+    "calls_launched": 0,
+    "calls_used": 0,          # results that were actually inspected
+    "calls_wasted": 0,        # in flight when a winner was found, result discarded
+    "runs_without_winner": 0,
+    "latency_saved_s": 0.0,   # estimated serial time minus actual wall time (negative = slower)
+    "wasted_call_s": 0.0,     # estimated LLM time spent on discarded calls
+    "index_seeded": 0,        # pools topped up with a top-K build from the offline index
+    "index_fallbacks": 0,     # rerolls exhausted, novel top-K build used instead
+    "exhausted": 0,           # no novel build from rerolls or the index, the current entry was kept
+}
+_reroll_metrics_lock = threading.Lock()
+
 def _bump_name(name: str) -> str:
     """
     If name ends with '(N)' or '#N', increment N. Otherwise append ' (2)'.
@@ -55,42 +92,12 @@ def _get_existing_loadout_for(role: str, enemy: str) -> dict | None:
 
 
 def filter_category(data, category, enemy_type=None, count=5):
-    pool = []
-    for item in data.get("loadout", []):
-        if item.get("Type") == category:
-            if enemy_type:
-                score = float(item.get(f"{enemy_type.lower()}_effectiveness", 0))
-            else:
-                score = get_average_effectiveness(item)
-            pool.append({
-                "name": item["Name"],
-                "score": score,
-                "Type": item.get("Type", ""),
-                "Damage Type": item.get("Damage Type", ""),
-                "special_traits": item.get("special_traits", ""),
-                "goal": item.get("Goal", "")
-            })
-    return weighted_choice(pool, count)
+    return weighted_choice(score_category(data, category, enemy_type), count)
 
 def filter_stratagems(data, enemy_type=None):
-    pool = []
-    for item in data.get("stratagems", []):
-        if enemy_type:
-            score = float(item.get(f"{enemy_type.lower()}_effectiveness", 0))
-        else:
-            score = get_average_effectiveness(item)
-        pool.append({
-            "name": item["name"],
-            "score": score,
-            "category": item.get("category", ""),
-            "Damage Type": item.get("Damage Type", ""),
-            "squad_role": item.get("squad_role", ""),
-            "is_backpack": item.get("BackPack", "No") == "Yes",
-            "is_disposable": item.get("Disposable", "No") == "Yes",
-            "special_traits": item.get("special_traits", ""),
-            "goal": item.get("Goal", "")
-        })
+    return _sample_stratagems(score_stratagems(data, enemy_type))
 
+def _sample_stratagems(pool):
     chosen = []
     support_count = 0
     backpack_count = 0
@@ -119,19 +126,21 @@ def filter_stratagems(data, enemy_type=None):
     return chosen
 
 def generate_filtered_pool(data, enemy_type=None):
+    # A Catalog already holds the scored candidates; only the random sampling runs per call
+    if isinstance(data, Catalog):
+        scored = data.scored_pool(enemy_type)
+    else:
+        scored = score_pool(data, enemy_type)
     return {
-        "primaries": filter_category(data, "Primary", enemy_type, 5),
-        "secondaries": filter_category(data, "Secondary", enemy_type, 5),
-        "grenades": filter_category(data, "Throwable", enemy_type, 5),
-        "armor_passives": filter_category(data, "Armor Passives", enemy_type, 5),
-        "stratagems": filter_stratagems(data, enemy_type)
+        "primaries": weighted_choice(scored["primaries"], 5),
+        "secondaries": weighted_choice(scored["secondaries"], 5),
+        "grenades": weighted_choice(scored["grenades"], 5),
+        "armor_passives": weighted_choice(scored["armor_passives"], 5),
+        "stratagems": _sample_stratagems(scored["stratagems"])
     }
 
 # Role selection if not provided
 # --- STRATAGEM HELPERS --------------------------------------------------------
-is_support = lambda s: s["category"] == "Support Weapons" and not s.get("is_disposable", False)
-is_backpack = lambda s: s.get("is_backpack", False) and not s.get("is_disposable", False)
-
 def dedupe_by_name(items):
     best = {}
     for s in items:
@@ -151,26 +160,6 @@ def trim_to_four(strats):
     )
     return strats[:4]
 
-def check_loadout_needs_fix(loadout):
-    strats = loadout.get("stratagems", [])
-    names = [s["name"] for s in strats]
-    duplicate = len(names) != len(set(names))
-
-    support_cnt = sum(1 for s in strats if is_support(s))
-    backpack_cnt = sum(1 for s in strats if is_backpack(s))
-    four_strats  = len(strats) == 4
-
-    # Hazard‑armor logic unchanged -------------
-    items = list(loadout["loadout"].values()) + strats
-    dmg_types = [i.get("Damage Type") for i in items if i.get("Damage Type")]
-    counts = Counter(dmg_types)
-    hazard = next((d for d, c in counts.items() if d in ["Toxic Gas", "Fire", "ARC"] and c >= 2), None)
-    armor_type = loadout["loadout"].get("armor_passive", {}).get("Damage Type")
-    armor_bad  = (hazard and armor_type != hazard) or (not hazard and armor_type in ["Toxic Gas", "Fire", "ARC"])
-
-    return duplicate or support_cnt != 1 or backpack_cnt > 1 or not four_strats or armor_bad
-
-
 def validate_stratagems(loadout, pool, role=None, max_passes=10):
     """
     Guarantees:
@@ -254,20 +243,125 @@ def count_item_usage(cache: dict, item_name: str, *, _max=12) -> int:
         if total >= _max:                # minor micro‑opt
             break
     return total
+
+# -------------------- Novelty (item-ID bitsets) --------------------
+
+def catalog_bit_ids(helldivers_data) -> dict:
+    """Assigns every catalog item (gear, then stratagems) a bit position by name."""
+    if isinstance(helldivers_data, Catalog):
+        return helldivers_data.bit_ids
+    names = [i["Name"] for i in helldivers_data.get("loadout", [])]
+    names += [s["name"] for s in helldivers_data.get("stratagems", [])]
+    return {name: bit for bit, name in enumerate(dict.fromkeys(names))}
+
+
+def loadout_item_names(loadout) -> list:
+    ld = _coerce_to_loadout(loadout)
+    if not ld:
+        return []
+    names = [g.get("name") for g in ld["loadout"].values() if isinstance(g, dict)]
+    names += [s.get("name") for s in ld["stratagems"] if isinstance(s, dict)]
+    return [n for n in names if n]
+
+
+def encode_item_names(names, bit_ids) -> int:
+    bits = 0
+    for name in names:
+        bit = bit_ids.get(name)
+        if bit is not None:
+            bits |= 1 << bit
+    return bits
+
+
+def item_changes(a: int, b: int) -> int:
+    """Items swapped between two encoded builds. Order-insensitive; each swap flips two bits."""
+    return ((a ^ b).bit_count() + 1) // 2
+
+
 def differs_by_three_or_more(old, new):
     """Checks if the new loadout differs by at least 3 LoadOut+stratagem items."""
-    old = _coerce_to_loadout(old)
-    new = _coerce_to_loadout(new)
-    if not old:
+    old_names = loadout_item_names(old)
+    if not old_names:
         return True  # No old loadout to compare
-    diff_count = sum(
-        1 for k in ["primary", "secondary", "grenade", "armor_passive"]
-        if old["loadout"].get(k, {}).get("name") != new["loadout"].get(k, {}).get("name")
-    ) + sum(
-        1 for s1, s2 in zip(old["stratagems"], new["stratagems"])
-        if s1.get("name") != s2.get("name")
-    )
-    return diff_count >= 3
+    new_names = loadout_item_names(new)
+    bit_ids = {name: bit for bit, name in enumerate(dict.fromkeys(old_names + new_names))}
+    return item_changes(encode_item_names(old_names, bit_ids),
+                        encode_item_names(new_names, bit_ids)) >= MIN_ITEM_CHANGES
+
+
+def novelty_checker(key, old_loadout, bit_ids, window=NOVELTY_WINDOW):
+    """
+    Returns is_novel(candidate): True when the candidate is a well-formed loadout
+    that changes at least MIN_ITEM_CHANGES items versus every build in the key's
+    history window (plus the currently cached one). Costs one XOR + popcount per
+    remembered build.
+    """
+    history = load_history(key)[-window:]
+    history_bits = [encode_item_names(names, bit_ids) for names in history]
+    if loadout_item_names(old_loadout):
+        history_bits.append(encode_item_names(loadout_item_names(old_loadout), bit_ids))
+
+    def is_novel(candidate):
+        # generate_helldivers_loadout may hand back [parsed, False] on bad JSON
+        if isinstance(candidate, list) or not _coerce_to_loadout(candidate):
+            return False
+        bits = encode_item_names(loadout_item_names(candidate), bit_ids)
+        return all(item_changes(bits, h) >= MIN_ITEM_CHANGES for h in history_bits)
+
+    return is_novel
+
+# Returns the live Catalog (main sets this to CatalogStore.current); None = no hot reload.
+_catalog_provider = None
+
+
+def set_catalog_provider(provider):
+    global _catalog_provider
+    _catalog_provider = provider
+
+
+# Charges LLM calls made outside the scheduler (main sets this to its TokenBucket.charge); None = uncharged.
+_budget_charger = None
+
+
+def set_budget_charger(charge):
+    global _budget_charger
+    _budget_charger = charge
+
+
+@contextmanager
+def _charging_budget():
+    """Charges the LLM calls made inside the block to the refresh scheduler's budget."""
+    with track_usage() as usage:
+        yield
+    if _budget_charger and usage["calls"]:
+        _budget_charger(usage["calls"])
+
+
+def _stale_items(final_output, helldivers_data) -> set:
+    """
+    Items in `final_output` that the live catalog changed or removed since
+    `helldivers_data` (the snapshot the refresh was built from) was current.
+    """
+    current = _catalog_provider() if _catalog_provider else None
+    if not isinstance(helldivers_data, Catalog) or current is None or current.version == helldivers_data.version:
+        return set()
+    return current.changed_items(helldivers_data).intersection(loadout_item_names(final_output))
+
+
+def invalidate_loadouts(item_names) -> list:
+    """
+    Flags cached loadouts that use any of `item_names`, e.g. items a catalog
+    reload changed or removed, as stale. They keep being served until their
+    next refresh; the scheduler, when enabled, ranks them first.
+    """
+    cache = load_cache_snapshot()
+    stale = [key for key, entry in cache.items()
+             if not item_names.isdisjoint(loadout_item_names(entry))]
+    if stale:
+        stale = mark_cache_entries_stale(stale)
+        print(f"[CACHE] Marked {stale} stale after catalog change")
+    return stale
+
 
 def replace_overused_items(loadout, pool, cache, role, max_dupes=3):
     """
@@ -310,7 +404,8 @@ def replace_overused_items(loadout, pool, cache, role, max_dupes=3):
     # ------- final safety: run validator once more
     return validate_stratagems(loadout, pool, role)
 
-def update_cached_loadout(role, enemy, helldivers_data, reroll_limit=5):
+def update_cached_loadout(role, enemy, helldivers_data, reroll_limit=5,
+                          speculative_k=SPECULATIVE_K, max_calls=SPECULATIVE_MAX_CALLS):
     """Generates, cleans, and saves a new loadout for the given role+enemy."""
 
     #cache = load_json(CACHE_FILE)
@@ -357,39 +452,385 @@ def update_cached_loadout(role, enemy, helldivers_data, reroll_limit=5):
 
     # ---------- ORIGINAL LOGIC BELOW ----------
 
-    cache = load_json(CACHE_FILE)
-    pool = generate_filtered_pool(helldivers_data, enemy)
-    old_loadout = cache.get(f"{role}_{enemy}")
+    key = f"{role}_{enemy}"
+
+    # Only one worker refreshes a given pair at a time; the rest skip.
+    with refresh_lease(key) as acquired:
+        if not acquired:
+            print(f"[CACHE] {key} is already being refreshed by another worker, skipping.")
+            return None
+        return _regenerate_loadout(role, enemy, helldivers_data, reroll_limit,
+                                   speculative_k, max_calls)
 
+
+def _pick_novel_candidate(pool, role, is_novel, reroll_limit,
+                          speculative_k=SPECULATIVE_K, max_calls=SPECULATIVE_MAX_CALLS):
+    """
+    Rerolls GPT selections until one passes `is_novel` (see novelty_checker).
+    Returns (candidate, novel); on exhaustion the last attempt comes back with novel=False.
+    Either mode makes at most `reroll_limit` selection calls; `max_calls` can only lower that.
+    """
+    if speculative_k > 1:
+        return _pick_novel_candidate_speculative(pool, role, is_novel, speculative_k,
+                                                 min(max_calls, reroll_limit))
+
+    new_loadout = None
     for attempt in range(reroll_limit):
         new_loadout = generate_helldivers_loadout(pool, role=role)
 
-        # Enforce 3-difference rule
-        if not differs_by_three_or_more(old_loadout, new_loadout):
-            continue
+        # Enforce 3-difference rule against the recent history
+        if is_novel(new_loadout):
+            return new_loadout, True
+    return new_loadout, False
+
 
-        # Enforce stratagem rules
-        if check_loadout_needs_fix(new_loadout):
-            new_loadout = validate_stratagems(new_loadout, pool, role=role)
+def _pick_novel_candidate_speculative(pool, role, is_novel, k, max_calls):
+    """
+    Keeps up to `k` selection calls in flight (never more than `max_calls` in total)
+    and takes the first result that is valid JSON and passes `is_novel`.
+    Calls still running at that point cannot be interrupted mid-request; their
+    results are dropped and counted as wasted.
+    """
+    def timed_selection():
+        started = time.perf_counter()
+        result = generate_helldivers_loadout(pool, role=role)
+        return result, time.perf_counter() - started
+
+    run_started = time.perf_counter()
+    launched = used = 0
+    call_seconds = 0.0
+    winner = last = None
+    pending = set()
+
+    executor = ThreadPoolExecutor(max_workers=k)
+    try:
+        while True:
+            while launched < max_calls and len(pending) < k:
+                # Carry the caller's context so per-pair token tracking sees these calls
+                pending.add(executor.submit(contextvars.copy_context().run, timed_selection))
+                launched += 1
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                used += 1
+                try:
+                    candidate, seconds = future.result()
+                except Exception as e:
+                    print(f"[REROLL] Speculative selection failed: {e}")
+                    continue
+                call_seconds += seconds
+                last = candidate
+                if is_novel(candidate):
+                    winner = candidate
+                    break
+            if winner is not None:
+                break
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    wall = time.perf_counter() - run_started
+    # A serial reroll loop would have paid for every inspected call back to back.
+    avg_call = call_seconds / used if used else 0.0
+    with _reroll_metrics_lock:
+        _reroll_metrics["speculative_runs"] += 1
+        _reroll_metrics["calls_launched"] += launched
+        _reroll_metrics["calls_used"] += used
+        _reroll_metrics["calls_wasted"] += launched - used
+        if winner is None:
+            _reroll_metrics["runs_without_winner"] += 1
+        _reroll_metrics["latency_saved_s"] += used * avg_call - wall
+        _reroll_metrics["wasted_call_s"] += (launched - used) * avg_call
 
-        # Replace overused items (LoadOut + stratagems)
-        new_loadout = replace_overused_items(new_loadout, pool, cache, role)
+    if winner is not None:
+        return winner, True
+    return last, False
 
-        # After fixes, ensure it still has 4 stratagems and passes rules
-        if check_loadout_needs_fix(new_loadout):
-            new_loadout = validate_stratagems(new_loadout, pool, role=role)
 
-        # Passed all checks
-        final_output = rewrite_flavor_text(new_loadout, role=role, enemy=enemy)
-        cache[f"{role}_{enemy}"] = final_output
-        save_cache(cache)
-        return final_output
+def get_reroll_metrics() -> dict:
+    with _reroll_metrics_lock:
+        return dict(_reroll_metrics)
 
-    # If no valid build after rerolls, fall back to last attempt (even if not perfect)
-    final_output = rewrite_flavor_text(new_loadout, role=role, enemy=enemy)
-    cache[f"{role}_{enemy}"] = final_output
-    save_cache(cache)
+
+# -------------------- Offline build index (see BuildOptimizer) --------------------
+
+def _indexed_pool(key, helldivers_data, enemy):
+    """
+    generate_filtered_pool plus the items of one build drawn from the pair's
+    top-K index, so the LLM always has a near-optimal build within reach.
+    """
+    pool = generate_filtered_pool(helldivers_data, enemy)
+    build = draw_indexed_build(key, helldivers_data, enemy)
+    if build:
+        for slot, category in GEAR_SLOTS:
+            if build["loadout"][slot]["name"] not in {i["name"] for i in pool[category]}:
+                pool[category].append(build["loadout"][slot])
+        names = {s["name"] for s in pool["stratagems"]}
+        pool["stratagems"] += [s for s in build["stratagems"] if s["name"] not in names]
+        with _reroll_metrics_lock:
+            _reroll_metrics["index_seeded"] += 1
+    return pool
+
+
+def _index_fallback(key, helldivers_data, enemy, is_novel, last_attempt):
+    """
+    Swaps a stale last reroll for a novel top-K build when the index has one.
+    If it has none the refresh is exhausted: callers keep the current entry.
+    """
+    build = draw_indexed_build(key, helldivers_data, enemy, is_novel)
+    if build is None:
+        with _reroll_metrics_lock:
+            _reroll_metrics["exhausted"] += 1
+        print(f"[REROLL] {key}: every pick repeats a recent build, keeping the current entry")
+        return last_attempt, False
+    with _reroll_metrics_lock:
+        _reroll_metrics["index_fallbacks"] += 1
+    print(f"[REROLL] {key}: no novel LLM pick, using an indexed top-K build")
+    return build, True
+
+
+def _enforce_loadout_rules(new_loadout, pool, cache, role):
+    # Enforce stratagem rules
+    if check_loadout_needs_fix(new_loadout):
+        new_loadout = validate_stratagems(new_loadout, pool, role=role)
+
+    # Replace overused items (LoadOut + stratagems)
+    new_loadout = replace_overused_items(new_loadout, pool, cache, role)
+
+    # After fixes, ensure it still has 4 stratagems and passes rules
+    if check_loadout_needs_fix(new_loadout):
+        new_loadout = validate_stratagems(new_loadout, pool, role=role)
+    return new_loadout
+
+
+def build_refreshed_loadout(role, enemy, helldivers_data, cache=None, reroll_limit=5,
+                            speculative_k=SPECULATIVE_K, max_calls=SPECULATIVE_MAX_CALLS, cache_lock=None):
+    """
+    Selection, validation and flavor pass for one pair, without saving anything.
+    With `cache_lock`, `cache` is a working copy shared by concurrent refreshes:
+    the over-use rules run under the lock and the pick is written back into it,
+    so pairs refreshed side by side see each other's builds.
+    Returns None when no novel build was found; the current entry stays.
+    """
+    key = f"{role}_{enemy}"
+    if cache is None:
+        cache = load_cache_snapshot()
+    pool = _indexed_pool(key, helldivers_data, enemy)
+    is_novel = novelty_checker(key, cache.get(key), catalog_bit_ids(helldivers_data))
+
+    new_loadout, novel = _pick_novel_candidate(pool, role, is_novel, reroll_limit,
+                                               speculative_k, max_calls)
+    if not novel:
+        new_loadout, novel = _index_fallback(key, helldivers_data, enemy, is_novel, new_loadout)
+    # Saving a repeat would break the no-repeat window
+    if not novel:
+        return None
+
+    with cache_lock or nullcontext():
+        new_loadout = _enforce_loadout_rules(new_loadout, pool, cache, role)
+        if cache_lock is not None:
+            cache[key] = new_loadout
+
+    return rewrite_flavor_text(new_loadout, role=role, enemy=enemy)
+
+
+def _regenerate_loadout(role, enemy, helldivers_data, reroll_limit,
+                        speculative_k=SPECULATIVE_K, max_calls=SPECULATIVE_MAX_CALLS):
+    final_output = build_refreshed_loadout(role, enemy, helldivers_data, None, reroll_limit,
+                                           speculative_k, max_calls)
+    if final_output is not None:
+        _save_refreshed(f"{role}_{enemy}", final_output, helldivers_data)
     return final_output
 
 
+def _is_saveable(key, final_output, helldivers_data=None) -> bool:
+    """
+    A refreshed entry may only be saved if it is a complete loadout; an
+    unusable LLM answer must not overwrite the cache or be stamped fresh.
+    Nor may a build that uses items a catalog reload changed or removed
+    while it was being generated (invalidate_loadouts has already run).
+    """
+    if _coerce_to_loadout(final_output) is not final_output or not loadout_item_names(final_output):
+        print(f"[CACHE] {key}: refreshed entry has no usable loadout, not saving.")
+        return False
+    stale = _stale_items(final_output, helldivers_data)
+    if stale:
+        print(f"[CACHE] {key}: built from catalog {helldivers_data.version}, "
+              f"uses changed/removed {sorted(stale)}, not saving.")
+        return False
+    return True
+
+
+def _save_refreshed(key, final_output, helldivers_data=None) -> bool:
+    if not _is_saveable(key, final_output, helldivers_data):
+        return False
+    final_output["updated_at"] = time.time()  # staleness signal for the refresh scheduler
+    save_cache_entry(key, final_output)
+    append_history(key, loadout_item_names(final_output), NOVELTY_WINDOW)
+    return True
+
+
+def build_refreshed_loadouts(pairs, helldivers_data, cache=None, reroll_limit=5, flavor_workers=4,
+                             cache_lock=None):
+    """
+    Batched build_refreshed_loadout: one LLM call selects gear for every
+    (role, enemy) in `pairs`. Pairs whose block is missing or fails the novelty
+    rule fall back to the per-pair reroll loop. The over-use rules are then
+    applied pair by pair against a working copy of the cache, so each pair sees
+    the picks of the pairs before it. Flavor text still runs per pair,
+    `flavor_workers` at a time. Returns {key: final_output} without saving;
+    a pair that raises, or finds no novel build, is left out and the others
+    are still returned.
+    With `cache_lock`, `cache` itself is the shared working copy (see
+    build_refreshed_loadout) and the picks are written into it.
+    """
+    if cache is None:
+        cache = load_cache_snapshot()
+    bit_ids = catalog_bit_ids(helldivers_data)
+    requests, checks = {}, {}
+    for role, enemy in pairs:
+        key = f"{role}_{enemy}"
+        requests[key] = (_indexed_pool(key, helldivers_data, enemy), role)
+        checks[key] = novelty_checker(key, cache.get(key), bit_ids)
+
+    selections = generate_helldivers_loadouts_batch(requests)
+
+    def select(role, enemy):
+        key = f"{role}_{enemy}"
+        pool, is_novel = requests[key][0], checks[key]
+        new_loadout = selections.get(key)
+        novel = is_novel(new_loadout)
+        if not novel:
+            # The batched pick counts as the first attempt
+            new_loadout, novel = _pick_novel_candidate(pool, role, is_novel, max(1, reroll_limit - 1))
+        if not novel:
+            new_loadout, novel = _index_fallback(key, helldivers_data, enemy, is_novel, new_loadout)
+        return new_loadout, novel
+
+    def run_per_pair(executor, fn, todo):
+        futures = [executor.submit(contextvars.copy_context().run, fn, role, enemy) for role, enemy in todo]
+        done = {}
+        for (role, enemy), future in zip(todo, futures):
+            try:
+                done[(role, enemy)] = future.result()
+            except Exception as e:
+                print(f"[CACHE] Batched refresh of {role}_{enemy} failed: {e}")
+        return done
+
+    with ThreadPoolExecutor(max_workers=max(1, min(flavor_workers, len(pairs)))) as executor:
+        picked = run_per_pair(executor, select, pairs)
+
+        # Over-use caps count items across the whole cache, so apply them in order
+        working = cache if cache_lock is not None else dict(cache)
+        loadouts = {}
+        with cache_lock or nullcontext():
+            for (role, enemy), (new_loadout, novel) in picked.items():
+                key = f"{role}_{enemy}"
+                if not novel:
+                    continue
+                try:
+                    new_loadout = _enforce_loadout_rules(new_loadout, requests[key][0], working, role)
+                except Exception as e:
+                    print(f"[CACHE] Batched refresh of {role}_{enemy} failed: {e}")
+                    continue
+                working[key] = loadouts[(role, enemy)] = new_loadout
+
+        flavored = run_per_pair(executor, lambda role, enemy: rewrite_flavor_text(
+            loadouts[(role, enemy)], role=role, enemy=enemy), list(loadouts))
+    return {f"{role}_{enemy}": final_output for (role, enemy), final_output in flavored.items()}
+
+
+def save_refreshed_loadouts(results: dict, helldivers_data=None) -> dict:
+    """
+    Stamps and saves several refreshed entries with a single cache write.
+    Returns the entries that were saved (unusable ones are skipped).
+    """
+    results = {key: entry for key, entry in results.items() if _is_saveable(key, entry, helldivers_data)}
+    if not results:
+        return {}
+    now = time.time()
+    for entry in results.values():
+        entry["updated_at"] = now
+    save_cache_entries(results)
+    for key, entry in results.items():
+        append_history(key, loadout_item_names(entry), NOVELTY_WINDOW)
+    return results
+
+
+def update_cached_loadouts(pairs, helldivers_data, reroll_limit=5):
+    """
+    Batched update_cached_loadout, used by the refresh scheduler when several
+    pairs are due. Pairs another worker is already refreshing are skipped.
+    """
+    with ExitStack() as stack:
+        leased = []
+        for role, enemy in pairs:
+            if stack.enter_context(refresh_lease(f"{role}_{enemy}")):
+                leased.append((role, enemy))
+            else:
+                print(f"[CACHE] {role}_{enemy} is already being refreshed by another worker, skipping.")
+        if not leased:
+            return {}
+        results = build_refreshed_loadouts(leased, helldivers_data, None, reroll_limit)
+        return save_refreshed_loadouts(results, helldivers_data)
+
+
+def stream_loadout(role, enemy, helldivers_data, reroll_limit=5):
+    """
+    Runs the refresh pipeline synchronously for the SSE endpoint.
+    Yields (event, data) pairs: a provisional "gear_locked" straight away (the
+    cached or an indexed build), the real "gear_locked", "stratagems_validated",
+    a run of "token" events for the flavor text, then "done" with the entry.
+    The LLM calls are charged to the refresh scheduler's budget as they are
+    made. The pair's refresh lease is only taken for the save: if another
+    worker holds it, "done" has saved=False. A build that is not novel is
+    still streamed but never saved.
+    """
+    key = f"{role}_{enemy}"
+    cache = load_cache_snapshot()
+
+    # Something to render before the selection call returns
+    provisional = _coerce_to_loadout(cache.get(key)) or draw_indexed_build(key, helldivers_data, enemy)
+    if provisional:
+        yield "gear_locked", {"loadout": provisional.get("loadout", {}), "novel": False, "provisional": True}
+
+    pool = _indexed_pool(key, helldivers_data, enemy)
+
+    is_novel = novelty_checker(key, cache.get(key), catalog_bit_ids(helldivers_data))
+
+    with _charging_budget():
+        new_loadout, novel = _pick_novel_candidate(pool, role, is_novel, reroll_limit)
+    if not novel:
+        new_loadout, novel = _index_fallback(key, helldivers_data, enemy, is_novel, new_loadout)
+    yield "gear_locked", {"loadout": _coerce_to_loadout(new_loadout).get("loadout", {}), "novel": novel,
+                          "provisional": False}
+
+    if novel:
+        new_loadout = _enforce_loadout_rules(new_loadout, pool, cache, role)
+    yield "stratagems_validated", {"stratagems": _coerce_to_loadout(new_loadout).get("stratagems", [])}
+
+    final_output = {}
+    flavor = stream_flavor_text(new_loadout, role=role, enemy=enemy)
+    while True:
+        # Charged step by step: the budget sees the call even if the client goes away mid-stream
+        with _charging_budget():
+            step = next(flavor, None)
+        if step is None:
+            break
+        event, data = step
+        if event == "flavor":
+            final_output = data
+        else:
+            yield event, data
 
+    saved = False
+    if novel:
+        with refresh_lease(key) as acquired:
+            if acquired:
+                saved = _save_refreshed(key, final_output, helldivers_data)
+            else:
+                print(f"[CACHE] {key} is already being refreshed by another worker, streaming without saving.")
+    yield "done", {**final_output, "saved": saved}
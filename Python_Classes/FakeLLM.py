@@ -0,0 +1,145 @@
+import ast
+import json
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+# Stand-in for the OpenAI client used by the load tester and the offline CLI.
+# It answers the selection and flavor prompts from OpenAIRequest with random
+# picks from the pool it was given, after a configurable delay.
+
+_POOL_LABELS = {
+    "primaries": "Primaries",
+    "secondaries": "Secondaries",
+    "grenades": "Grenades",
+    "armor_passives": "Armor Passives",
+    "stratagems": "Stratagems",
+}
+_NAMES = ["Searing", "Phantom", "Crushing", "Iron", "Hollow", "Burning", "Silent", "Shattered"]
+_NOUNS = ["Hammer", "Shroud", "Phalanx", "Lantern", "Spire", "Talon", "Bastion", "Ember"]
+
+
+class FakeLLMError(RuntimeError):
+    pass
+
+
+class _FakeCompletions:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, **kwargs):
+        return self._owner._create(**kwargs)
+
+
+class FakeOpenAIClient:
+    """
+    Mimics `client.chat.completions.create` closely enough for OpenAIRequest:
+    honours `timeout` and `stream`, and reports rough token usage.
+    """
+
+    def __init__(self, latency_s=0.5, jitter_s=0.0, failure_rate=0.0, seed=None):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.failure_rate = failure_rate
+        self.chat = SimpleNamespace(completions=_FakeCompletions(self))
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _delay(self):
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency_s + self._rng.uniform(-self.jitter_s, self.jitter_s))
+            fail = self._rng.random() < self.failure_rate
+        return delay, fail
+
+    def _create(self, messages, timeout=None, stream=False, **kwargs):
+        prompt = messages[-1]["content"]
+        delay, fail = self._delay()
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"fake LLM exceeded {timeout}s")
+        if not stream:
+            time.sleep(delay)
+        if fail:
+            raise FakeLLMError("fake upstream error")
+
+        with self._lock:
+            text = json.dumps(self._answer(prompt))
+        usage = SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=len(text) // 4,
+                                total_tokens=(len(prompt) + len(text)) // 4)
+        if stream:
+            return self._stream(text, delay)
+        message = SimpleNamespace(content=text)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    def _stream(self, text, delay):
+        pieces = [text[i:i + 8] for i in range(0, len(text), 8)]
+        step = delay / max(1, len(pieces))
+        for piece in pieces:
+            time.sleep(step)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+    # ---- canned answers ----------------------------------------------------
+
+    def _answer(self, prompt):
+        if "You are selecting Helldivers 2 loadouts for several" in prompt:
+            return self._batch_selection(prompt)
+        if "You are selecting a Helldivers 2 loadout" in prompt:
+            return self._selection(prompt)
+        return self._flavor(prompt)
+
+    def _pool_names(self, prompt, label):
+        # The selection prompt ends with one "Label: ['a', 'b']" line per category
+        matches = re.findall(rf"^\s*{re.escape(label)}: (\[.*\])\s*$", prompt, re.M)
+        return ast.literal_eval(matches[-1]) if matches else []
+
+    def _selection(self, prompt):
+        def pick(label, k=1):
+            names = self._pool_names(prompt, label)
+            return self._rng.sample(names, min(k, len(names)))
+
+        gear = {}
+        for slot, key in [("primary", "primaries"), ("secondary", "secondaries"),
+                          ("grenade", "grenades"), ("armor_passive", "armor_passives")]:
+            names = pick(_POOL_LABELS[key])
+            gear[slot] = {"name": names[0] if names else ""}
+        return {
+            "loadout": gear,
+            "stratagems": [{"name": n} for n in pick("Stratagems", 4)],
+        }
+
+    def _batch_selection(self, prompt):
+        # One "Pair: <key>" section per pair, each with its own label lines
+        parts = re.split(r"^\s*Pair: (.+?)\s*$", prompt, flags=re.M)
+        return {"builds": {key: self._selection(body) for key, body in zip(parts[1::2], parts[2::2])}}
+
+    def _flavor(self, prompt):
+        gear = re.search(r"Gear:\s*(.*?)\s*Stratagems:", prompt, re.S)
+        strats = re.search(r"Stratagems:\s*(.*?)\s*Task:", prompt, re.S)
+        name = f"{self._rng.choice(_NAMES)} {self._rng.choice(_NOUNS)}"
+        return {
+            "loadout": json.loads(gear.group(1)) if gear else {},
+            "stratagems": json.loads(strats.group(1)) if strats else [],
+            "how_to_play": {
+                "solo": "Keep moving and let the stratagems do the heavy lifting.",
+                "co_op": "Call targets for the squad and cover the reload windows.",
+                "positioning": "Stay on high ground with a clear exit.",
+                "combo_flow": "Orbital first, support weapon second, grenades to finish.",
+            },
+            "objective": "Hold the line and complete the primary objective.",
+            "lore": f"The {name} loadout was drafted by a simulated quartermaster.",
+            "loadout_name": name,
+        }
+
+
+def install(latency_s=0.5, jitter_s=0.0, failure_rate=0.0, seed=None):
+    """Points OpenAIRequest at a fake client and returns it."""
+    os.environ.setdefault("OPENAI_API_KEY", "fake-llm")  # OpenAIRequest refuses to import without one
+    import OpenAIRequest
+    fake = FakeOpenAIClient(latency_s, jitter_s, failure_rate, seed)
+    OpenAIRequest.client = fake
+    return fake
@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the LLM while the breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    closed    – calls go through; `failure_threshold` consecutive failures open it
+    open      – calls are refused for `cooldown_s` seconds
+    half_open – one trial call is let through; success closes, failure re-opens
+    """
+
+    def __init__(self, failure_threshold=5, cooldown_s=60.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.cooldown_s:
+                    raise CircuitOpenError("LLM circuit is open")
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open":
+                if self._trial_in_flight:
+                    raise CircuitOpenError("LLM circuit is half-open; trial call in flight")
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def record_abandoned(self):
+        """The caller gave up on a call before it finished; no verdict, but free the trial slot."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.state == "open" and time.monotonic() - self.opened_at < self.cooldown_s
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures,
+                    "times_opened": self.times_opened}
+
+
+class LatencyTracker:
+    """Rolling window of call latencies used to pick the hedge delay."""
+
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float):
+        """Returns the pct-th percentile, or None until enough samples exist."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[idx]
+
+
+def _start_call(slots, fn, **kwargs):
+    """
+    Runs fn(**kwargs) on a thread of its own if one of `slots` (a semaphore)
+    is free, else returns None straight away. Calls never queue for a thread,
+    so waiting cannot eat into their deadlines; the slot is held until fn
+    returns, so abandoned attempts still count against the ceiling.
+    """
+    if not slots.acquire(blocking=False):
+        return None
+    future = Future()
+
+    def run():
+        try:
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(fn(**kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+        finally:
+            slots.release()
+
+    threading.Thread(target=run, name="llm-hedge", daemon=True).start()
+    return future
+
+
+def call_hedged(fn, deadline_s: float, hedge_after: float, slots, on_hedge=None, on_skip=None, **kwargs):
+    """
+    Calls fn(**kwargs); if it has not answered after `hedge_after` seconds,
+    fires an identical second call and returns whichever succeeds first.
+    Raises TimeoutError once `deadline_s` seconds pass without a success.
+    Attempts run on at most `slots` background threads; when none is free the
+    call is not hedged (`on_skip` is called): the first attempt then runs on
+    the caller's thread, bounded by its own request timeout.
+    """
+    deadline = time.monotonic() + deadline_s
+    first = _start_call(slots, fn, **kwargs)
+    if first is None:
+        if on_skip:
+            on_skip()
+        return fn(**kwargs)
+    done, _ = wait([first], timeout=min(hedge_after, deadline_s))
+    if done:
+        return first.result()
+
+    second = _start_call(slots, fn, **kwargs)
+    if second is None:
+        if on_skip:
+            on_skip()
+        pending = {first}
+    else:
+        if on_hedge:
+            on_hedge()
+        pending = {first, second}
+    error = None
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    if error is not None and not pending:
+        raise error
+    raise TimeoutError(f"LLM call exceeded {deadline_s}s deadline")
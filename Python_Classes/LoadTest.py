@@ -0,0 +1,352 @@
+"""
+Load tester for the Dropzone API.
+
+    # in-process: drives main.app over ASGI with a fake LLM, scratch copy of the cache
+    python LoadTest.py --concurrency 32 --duration 20 --mix cached=0.8,generate=0.2 \
+        --llm-latency 2 --llm-jitter 0.5 --output results.json
+
+    # against a running server (start it with a fake or real LLM yourself)
+    python LoadTest.py --url http://localhost:8000 --concurrency 16 --requests 2000
+
+    # compare two runs
+    python LoadTest.py --compare baseline.json results.json
+
+Reports p50/p95/p99 latency, throughput and error rate per endpoint, plus
+thread-pool saturation for in-process runs (sync endpoints and background
+refreshes share AnyIO's worker-thread limiter).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode, urlsplit
+
+ROLES = ["Crowd Control", "Anti-Tank", "Saboteur", "Stratagem Support"]
+ENEMIES = ["automatons", "terminids", "illuminate"]
+DEFAULT_MIX = "cached=0.8,generate=0.2"
+
+
+def build_request(kind):
+    """(method, path, query, body) for one request of the given kind."""
+    role, enemy = random.choice(ROLES), random.choice(ENEMIES)
+    if kind == "generate":
+        return "POST", "/generate_loadout", "", json.dumps({"role": role, "enemy": enemy}).encode()
+    if kind == "cached":
+        return "GET", "/get_cached_loadout", urlencode({"role": role, "enemy": enemy}), b""
+    if kind == "stream":
+        return "GET", "/stream_loadout", urlencode({"role": role, "enemy": enemy}), b""
+    raise ValueError(f"Unknown request kind: {kind}")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        build_request(kind.strip())  # validates the kind
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+# -------------------- Transports --------------------
+
+class ASGITransport:
+    """Calls the ASGI app directly; latency stops at the last response byte,
+    so background tasks that run afterwards are not counted against the request."""
+
+    def __init__(self, app):
+        self.app = app
+        self._tails = set()  # app calls still running background work
+
+    async def request(self, method, path, query, body):
+        response_done = asyncio.Event()
+        status = {}
+        delivered = False
+
+        async def receive():
+            nonlocal delivered
+            if not delivered:
+                delivered = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await response_done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            elif message["type"] == "http.response.body" and not message.get("more_body"):
+                response_done.set()
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+            "query_string": query.encode(), "root_path": "",
+            "headers": [(b"host", b"loadtest"), (b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode())],
+            "client": ("127.0.0.1", 0), "server": ("loadtest", 80),
+        }
+        call = asyncio.ensure_future(self.app(scope, receive, send))
+        waiter = asyncio.ensure_future(response_done.wait())
+        await asyncio.wait({call, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        if not response_done.is_set():
+            waiter.cancel()
+            call.result()  # re-raises the app's exception
+            raise RuntimeError("app returned without a response")
+        if not call.done():
+            self._tails.add(call)
+            call.add_done_callback(self._tails.discard)
+        return status.get("code", 0)
+
+    async def close(self):
+        if self._tails:
+            await asyncio.gather(*self._tails, return_exceptions=True)
+
+
+class HTTPTransport:
+    """Minimal keep-alive HTTP/1.1 client, one connection per worker."""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 80
+
+    async def connect(self):
+        return await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, conn, method, path, query, body):
+        reader, writer = conn
+        target = f"{path}?{query}" if query else path
+        head = (f"{method} {target} HTTP/1.1\r\nHost: {self.host}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n")
+        writer.write(head.encode() + body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("server closed the connection")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode().partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding") == "chunked":
+            while True:
+                size = int((await reader.readline()).strip() or b"0", 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await reader.readexactly(int(headers.get("content-length", 0)))
+        return status
+
+# -------------------- Runner --------------------
+
+async def _sample_thread_pool(samples, stop):
+    from anyio import to_thread
+    limiter = to_thread.current_default_thread_limiter()
+    while not stop.is_set():
+        samples.append((limiter.borrowed_tokens, limiter.total_tokens))
+        await asyncio.sleep(0.01)
+
+
+async def run_load(transport, mix, concurrency, duration_s=None, total_requests=None, http=None):
+    kinds, weights = list(mix), list(mix.values())
+    results = {kind: {"latencies": [], "errors": 0} for kind in kinds}
+    issued = 0
+    deadline = time.perf_counter() + duration_s if duration_s else None
+
+    def next_kind():
+        nonlocal issued
+        if total_requests is not None and issued >= total_requests:
+            return None
+        if deadline is not None and time.perf_counter() >= deadline:
+            return None
+        issued += 1
+        return random.choices(kinds, weights=weights, k=1)[0]
+
+    async def worker():
+        conn = await http.connect() if http else None
+        while (kind := next_kind()) is not None:
+            method, path, query, body = build_request(kind)
+            started = time.perf_counter()
+            try:
+                if http:
+                    status = await http.request(conn, method, path, query, body)
+                else:
+                    status = await transport.request(method, path, query, body)
+                ok = status < 400
+            except Exception as e:
+                ok = False
+                print(f"[LOADTEST] {kind} failed: {e}", file=sys.stderr)
+                if http:
+                    conn = await http.connect()
+            elapsed = time.perf_counter() - started
+            results[kind]["latencies"].append(elapsed)
+            if not ok:
+                results[kind]["errors"] += 1
+        if conn:
+            conn[1].close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results, time.perf_counter() - started
+
+
+def _percentile(ordered, pct):
+    if not ordered:
+        return None
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[idx] * 1000, 2)
+
+
+def summarize(latencies, errors, elapsed):
+    ordered = sorted(latencies)
+    count = len(ordered)
+    return {
+        "count": count,
+        "errors": errors,
+        "error_rate": round(errors / count, 4) if count else 0.0,
+        "throughput_rps": round(count / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(ordered) / count * 1000, 2) if count else None,
+        "p50_ms": _percentile(ordered, 50),
+        "p95_ms": _percentile(ordered, 95),
+        "p99_ms": _percentile(ordered, 99),
+        "max_ms": round(ordered[-1] * 1000, 2) if count else None,
+    }
+
+
+def summarize_thread_pool(samples):
+    if not samples:
+        return None
+    total = samples[-1][1]
+    borrowed = [b for b, _ in samples]
+    return {
+        "total_tokens": total,
+        "max_borrowed": max(borrowed),
+        "mean_utilization": round(sum(borrowed) / len(borrowed) / total, 3),
+        "saturated_fraction": round(sum(1 for b, t in samples if b >= t) / len(samples), 3),
+    }
+
+
+def _use_scratch_cache():
+    """Points every cache/history/lock path at a temp copy so a run never touches ../json."""
+    import CacheSync
+    import utils
+    scratch = tempfile.mkdtemp(prefix="dropzone-loadtest-")
+    cache_copy = os.path.join(scratch, os.path.basename(CacheSync.CACHE_FILE))
+    if os.path.exists(CacheSync.CACHE_FILE):
+        shutil.copy(CacheSync.CACHE_FILE, cache_copy)
+    CacheSync.CACHE_FILE = utils.CACHE_FILE = cache_copy
+    CacheSync.VERSION_FILE = os.path.join(scratch, "versions.bin")
+    CacheSync.HISTORY_FILE = os.path.join(scratch, "history.json")
+    CacheSync.LOCK_DIR = os.path.join(scratch, "locks")
+    return scratch
+
+
+async def run_in_process(args, mix):
+    os.environ["DROPZONE_SCHEDULER"] = "1" if args.refresh == "scheduler" else "0"
+    import FakeLLM
+    fake = FakeLLM.install(args.llm_latency, args.llm_jitter, args.llm_failure_rate, args.seed)
+    scratch = _use_scratch_cache()
+    import main
+    from OpenAIRequest import get_llm_metrics
+
+    transport = ASGITransport(main.app)
+    samples, stop = [], asyncio.Event()
+    try:
+        async with main.app.router.lifespan_context(main.app):
+            sampler = asyncio.ensure_future(_sample_thread_pool(samples, stop))
+            results, elapsed = await run_load(transport, mix, args.concurrency,
+                                              args.duration, args.requests)
+            stop.set()
+            await sampler
+            # Let background refreshes drain so they are reflected in the LLM counters
+            await transport.close()
+            extra = {
+                "thread_pool": summarize_thread_pool(samples),
+                "llm": {**get_llm_metrics(), "fake_calls": fake.calls},
+                "scheduler": {k: v for k, v in main.scheduler.status().items() if k != "queue"},
+            }
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return results, elapsed, extra
+
+
+async def run_over_http(args, mix):
+    results, elapsed = await run_load(None, mix, args.concurrency, args.duration,
+                                      args.requests, http=HTTPTransport(args.url))
+    return results, elapsed, {"thread_pool": None}
+
+
+def compare(baseline_path, current_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(current_path, encoding="utf-8") as f:
+        cur = json.load(f)
+    print(f"{'endpoint':<10} {'metric':<15} {'baseline':>10} {'current':>10} {'delta':>9}")
+    for kind in sorted(set(base["endpoints"]) | set(cur["endpoints"]) | {"overall"}):
+        b = base["overall"] if kind == "overall" else base["endpoints"].get(kind, {})
+        c = cur["overall"] if kind == "overall" else cur["endpoints"].get(kind, {})
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "error_rate"):
+            bv, cv = b.get(metric), c.get(metric)
+            delta = f"{(cv - bv) / bv * 100:+.1f}%" if bv and cv is not None else "n/a"
+            print(f"{kind:<10} {metric:<15} {bv if bv is not None else '-':>10} "
+                  f"{cv if cv is not None else '-':>10} {delta:>9}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Load-test the Dropzone API.")
+    parser.add_argument("--url", help="Target a running server instead of the in-process app")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, help="Seconds to run (default 10 unless --requests)")
+    parser.add_argument("--requests", type=int, help="Total requests to send")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help="Weighted request kinds: generate, cached, stream (default %(default)s)")
+    parser.add_argument("--refresh", choices=["scheduler", "per-request"], default="scheduler",
+                        help="In-process refresh mode (DROPZONE_SCHEDULER)")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Fake LLM latency per call (s)")
+    parser.add_argument("--llm-jitter", type=float, default=0.0, help="± uniform jitter on that latency (s)")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="Print the difference between two saved runs and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.duration is None and args.requests is None:
+        args.duration = 10.0
+    if args.seed is not None:
+        random.seed(args.seed)
+    mix = parse_mix(args.mix)
+
+    runner = run_over_http if args.url else run_in_process
+    results, elapsed, extra = asyncio.run(runner(args, mix))
+
+    all_latencies = [l for r in results.values() for l in r["latencies"]]
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("compare", "output")},
+        "mix": mix,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "elapsed_s": round(elapsed, 3),
+        "overall": summarize(all_latencies, sum(r["errors"] for r in results.values()), elapsed),
+        "endpoints": {kind: summarize(r["latencies"], r["errors"], elapsed) for kind, r in results.items()},
+        **extra,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
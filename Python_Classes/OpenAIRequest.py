@@ -11,11 +11,155 @@ api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
     raise RuntimeError("OPENAI_API_KEY is not set")
 
-client = api_key
+# The SDK's own retries would stretch our deadlines; retries happen in generate_helldivers_loadout.
+client = OpenAI(api_key=api_key, max_retries=0)
 
-from utils import get_used_loadout_names
+from utils import get_used_loadout_names, weighted_choice
+from LLMGuard import CircuitBreaker, CircuitOpenError, LatencyTracker, call_hedged
+import contextvars
 import json
 import re
+import threading
+import time
+from contextlib import contextmanager
+
+# -------------------- Deadlines, hedging & circuit breaker --------------------
+
+SELECTION_TIMEOUT_S = float(os.getenv("DROPZONE_SELECTION_TIMEOUT_S", "30"))
+FLAVOR_TIMEOUT_S = float(os.getenv("DROPZONE_FLAVOR_TIMEOUT_S", "60"))
+# Hedging sends a second identical request once a call runs past the observed p95.
+HEDGE_ENABLED = os.getenv("DROPZONE_LLM_HEDGE", "0") == "1"
+HEDGE_PERCENTILE = 95
+# Ceiling on threads running hedged attempts (first tries and hedges alike); when
+# all are busy, calls go unhedged on the caller's thread instead of queueing.
+HEDGE_MAX_THREADS = int(os.getenv("DROPZONE_LLM_HEDGE_THREADS", "32"))
+# A batched selection answers for several pairs, so it gets a longer deadline of its own.
+BATCH_SELECTION_TIMEOUT_S = float(os.getenv("DROPZONE_BATCH_SELECTION_TIMEOUT_S", "90"))
+
+breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("DROPZONE_BREAKER_FAILURES", "5")),
+    cooldown_s=float(os.getenv("DROPZONE_BREAKER_COOLDOWN_S", "60")),
+)
+_latency = LatencyTracker()
+_hedge_slots = threading.BoundedSemaphore(HEDGE_MAX_THREADS)
+_llm_metrics = {"calls": 0, "failures": 0, "timeouts": 0, "hedges_sent": 0, "hedges_skipped": 0,
+                "short_circuited": 0,
+                "local_selections": 0, "template_flavors": 0,
+                "batch_calls": 0, "batch_pairs": 0, "batch_pairs_missing": 0,
+                "prompt_tokens": 0, "completion_tokens": 0}
+_llm_metrics_lock = threading.Lock()
+# Per-caller token tally, see track_usage()
+_usage_scope = contextvars.ContextVar("llm_usage_scope", default=None)
+
+
+def _count(metric, n=1):
+    with _llm_metrics_lock:
+        _llm_metrics[metric] += n
+
+
+@contextmanager
+def track_usage():
+    """
+    Collects LLM calls and token usage made inside the block (including worker
+    threads started with contextvars.copy_context()) into the yielded dict.
+    "calls" counts every request sent, hedged duplicates and failed attempts
+    included, since each one is paid for.
+    """
+    usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    token = _usage_scope.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage_scope.reset(token)
+
+
+def _record_usage(response):
+    usage = getattr(response, "usage", None)
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    with _llm_metrics_lock:
+        _llm_metrics["prompt_tokens"] += prompt
+        _llm_metrics["completion_tokens"] += completion
+        scope = _usage_scope.get()
+        if scope is not None:
+            scope["prompt_tokens"] += prompt
+            scope["completion_tokens"] += completion
+
+
+def _count_call(metric="calls"):
+    """Counts one request sent to the API, globally and in the active track_usage scope."""
+    with _llm_metrics_lock:
+        _llm_metrics[metric] += 1
+        scope = _usage_scope.get()
+        if scope is not None:
+            scope["calls"] += 1
+
+
+def get_llm_metrics() -> dict:
+    with _llm_metrics_lock:
+        metrics = dict(_llm_metrics)
+    metrics["breaker"] = breaker.snapshot()
+    metrics["p95_latency_s"] = _latency.percentile(HEDGE_PERCENTILE)
+    return metrics
+
+
+def _chat_completion(timeout, hedge=False, track_latency=True, **kwargs):
+    """
+    Single entry point for chat completions: per-call deadline, optional hedge
+    after p95, and circuit-breaker bookkeeping. Raises CircuitOpenError without
+    touching the network while the breaker is open. Pass track_latency=False for
+    calls (like batched selections) whose latency should not move the hedge p95.
+    With stream=True the returned iterator does the breaker bookkeeping itself:
+    success once the stream is fully read, failure if reading it raises.
+    """
+    try:
+        breaker.before_call()
+    except CircuitOpenError:
+        _count("short_circuited")
+        raise
+
+    _count_call()
+    started = time.perf_counter()
+    hedge_after = _latency.percentile(HEDGE_PERCENTILE) if hedge and HEDGE_ENABLED else None
+    try:
+        if hedge_after is not None:
+            response = call_hedged(client.chat.completions.create, timeout, hedge_after, _hedge_slots,
+                                   on_hedge=lambda: _count_call("hedges_sent"),
+                                   on_skip=lambda: _count("hedges_skipped"), timeout=timeout, **kwargs)
+        else:
+            response = client.chat.completions.create(timeout=timeout, **kwargs)
+    except Exception as e:
+        _record_failure(e)
+        raise
+
+    if kwargs.get("stream"):
+        # Streamed completions carry no usage block unless stream_options asks for it
+        return _guarded_stream(response)
+    breaker.record_success()
+    if track_latency:
+        _latency.record(time.perf_counter() - started)
+    _record_usage(response)
+    return response
+
+
+def _record_failure(e):
+    _count("failures")
+    if isinstance(e, TimeoutError) or "timeout" in type(e).__name__.lower():
+        _count("timeouts")
+    breaker.record_failure()
+
+
+def _guarded_stream(stream):
+    """Yields the stream's chunks; an error or stall mid-stream counts against the breaker."""
+    try:
+        yield from stream
+    except GeneratorExit:
+        breaker.record_abandoned()  # the consumer stopped reading (e.g. client went away)
+        raise
+    except Exception as e:
+        _record_failure(e)
+        raise
+    breaker.record_success()
 
 def safe_json_parse(raw: str):
     """
@@ -37,30 +181,243 @@ def safe_json_parse(raw: str):
     except json.JSONDecodeError:
         pass
 
-    # Salvage path – search for first balanced JSON object or array
-    for open_char, close_char in (("{", "}"), ("[", "]")):
-        start = cleaned.find(open_char)
-        if start == -1:
-            continue
-
-        depth = 0
-        for idx, ch in enumerate(cleaned[start:], start=start):
-            if ch == open_char:
-                depth += 1
-            elif ch == close_char:
-                depth -= 1
-                if depth == 0:                       # balanced block found
-                    candidate = cleaned[start:idx+1]
-                    try:
-                        return json.loads(candidate), True
-                    except json.JSONDecodeError:
-                        # keep scanning – maybe the next closing brace pairs correctly
-                        continue
+    # Salvage path – single string-aware pass over the text
+    salvager = JsonSalvager()
+    salvager.feed(cleaned)
+    data, ok = salvager.result()
+    if ok:
+        return data, True
 
     print("⚠️  GPT returned bad JSON that could not be salvaged.")
     return {}, False
 
 
+_STRUCTURAL = re.compile(r'[{}\[\]"]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+class JsonSalvager:
+    """
+    Finds the first valid top-level JSON object in noisy LLM output, fed in
+    one piece or chunk by chunk. A single pass tracks nesting depth while
+    skipping string literals and escapes, so braces inside strings never
+    split a block; every balanced block is decoded exactly once with
+    `raw_decode`. Malformed blocks are skipped whole, which keeps the total
+    work linear in the input. Objects nested only in arrays (as in
+    `[{"a": 1}]`) are decoded as they close, so an object is still preferred;
+    a balanced array is kept as a fallback in case no object turns up.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder(strict=False)  # tolerate raw newlines inside strings
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._parts = []        # earlier chunks of the block being scanned
+        self._block_start = 0   # where that block starts in the current chunk
+        self._open = []         # opener of every level, outermost first
+        self._objects_open = 0  # how many of those are "{"
+        self._obj_parts = []    # the same for an object nested only in arrays
+        self._obj_start = None
+        self._found = None
+        self._fallback = None
+
+    def feed(self, chunk: str):
+        """Scans `chunk`; returns the object as soon as one is complete, else None."""
+        if self._found is not None or not chunk:
+            return self._found
+
+        i, n = 0, len(chunk)
+        while i < n:
+            if self._escape:
+                self._escape = False
+                i += 1
+                continue
+
+            if self._in_string:
+                m = _STRING_SPECIAL.search(chunk, i)
+                if not m:
+                    break
+                i = m.end()
+                if m.group() == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+                continue
+
+            m = _STRUCTURAL.search(chunk, i)
+            if not m:
+                break
+            ch, i = m.group(), m.end()
+
+            if self._depth == 0:
+                # Prose before/between blocks: only an opener matters
+                if ch in "{[":
+                    self._depth = 1
+                    self._parts = []
+                    self._block_start = m.start()
+                    self._open = [ch]
+                    self._objects_open = int(ch == "{")
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if ch == "{":
+                    if self._objects_open == 0:
+                        # Only arrays around it: a candidate in its own right
+                        self._obj_parts = []
+                        self._obj_start = m.start()
+                    self._objects_open += 1
+                self._open.append(ch)
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._open.pop() == "{":
+                    self._objects_open -= 1
+                    if self._objects_open == 0 and self._obj_start is not None:
+                        block = "".join(self._obj_parts) + chunk[self._obj_start:i]
+                        self._obj_parts, self._obj_start = [], None
+                        if self._decode(block):
+                            return self._found
+                if self._depth == 0:
+                    block = "".join(self._parts) + chunk[self._block_start:i]
+                    self._parts = []
+                    self._obj_parts, self._obj_start = [], None
+                    if self._decode(block):
+                        return self._found
+
+        if self._depth > 0:
+            self._parts.append(chunk[self._block_start:])
+            self._block_start = 0
+            if self._obj_start is not None:
+                self._obj_parts.append(chunk[self._obj_start:])
+                self._obj_start = 0
+        return None
+
+    def _decode(self, block: str) -> bool:
+        try:
+            value, _ = self._decoder.raw_decode(block)
+        except ValueError:
+            return False
+        if isinstance(value, dict):
+            self._found = value
+            return True
+        if self._fallback is None:
+            self._fallback = value
+        return False
+
+    def result(self):
+        """(data, ok) in the same shape as safe_json_parse."""
+        if self._found is not None:
+            return self._found, True
+        if self._fallback is not None:
+            return self._fallback, True
+        return {}, False
+
+
+# Top-level keys whose string values are streamed to the client token by token.
+STREAMED_FIELDS = ("how_to_play", "lore")
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class StreamingJsonFields:
+    """
+    Streaming-tolerant companion to `safe_json_parse`.
+    Feed it completion chunks as they arrive; it tracks just enough JSON
+    structure (objects, arrays, strings, escapes) to report decoded text of
+    string values living under the wanted top-level keys, e.g.
+    ("how_to_play.solo", "Hold the ridge"). Never raises on partial input.
+    """
+
+    def __init__(self, fields=STREAMED_FIELDS):
+        self.fields = set(fields)
+        self._stack = []          # [kind, current_key, expecting_key] per open container
+        self._in_string = False
+        self._is_key = False
+        self._escape = False
+        self._unicode = None      # hex digits of a \uXXXX escape in progress
+        self._high_surrogate = None
+        self._key_chars = []
+
+    def _path(self):
+        return [frame[1] for frame in self._stack if frame[0] == "{" and frame[1] is not None]
+
+    def _wanted_field(self):
+        path = self._path()
+        if path and path[0] in self.fields:
+            return ".".join(path)
+        return None
+
+    def _emit_char(self, ch, field, out):
+        if self._is_key:
+            self._key_chars.append(ch)
+        elif field:
+            out.append((field, ch))
+
+    def _decode_unicode(self, code, field, out):
+        if 0xD800 <= code <= 0xDBFF:
+            self._high_surrogate = code
+            return
+        if self._high_surrogate is not None and 0xDC00 <= code <= 0xDFFF:
+            code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+        self._high_surrogate = None
+        self._emit_char(chr(code), field, out)
+
+    def feed(self, chunk: str):
+        """Consumes `chunk` and returns a list of (field, text) pieces, merged per field."""
+        out = []
+        field = self._wanted_field() if self._in_string else None
+        for ch in chunk:
+            if self._in_string:
+                if self._unicode is not None:
+                    self._unicode += ch
+                    if len(self._unicode) == 4:
+                        try:
+                            self._decode_unicode(int(self._unicode, 16), field, out)
+                        except ValueError:
+                            pass
+                        self._unicode = None
+                elif self._escape:
+                    self._escape = False
+                    if ch == "u":
+                        self._unicode = ""
+                    else:
+                        self._emit_char(_ESCAPES.get(ch, ch), field, out)
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._is_key and self._stack:
+                        self._stack[-1][1] = "".join(self._key_chars)
+                        self._stack[-1][2] = False
+                    self._key_chars = []
+                else:
+                    self._emit_char(ch, field, out)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._is_key = bool(self._stack) and self._stack[-1][0] == "{" and self._stack[-1][2]
+                field = None if self._is_key else self._wanted_field()
+            elif ch in "{[":
+                self._stack.append([ch, None, ch == "{"])
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+            elif ch == "," and self._stack and self._stack[-1][0] == "{":
+                self._stack[-1][2] = True
+
+        merged = []
+        for name, text in out:
+            if merged and merged[-1][0] == name:
+                merged[-1] = (name, merged[-1][1] + text)
+            else:
+                merged.append((name, text))
+        return merged
+
+
 
 def generate_helldivers_loadout(pool, role, max_gpt_retries=3):
     """
@@ -128,25 +485,178 @@ def generate_helldivers_loadout(pool, role, max_gpt_retries=3):
 
     # Send to GPT
     for attempt in range(max_gpt_retries):
-        response = client.chat.completions.create(
-            model="gpt-4-turbo",
-            response_format={"type": "json_object"},
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7
-        )
+        if breaker.is_open():
+            break
+        try:
+            response = _chat_completion(
+                SELECTION_TIMEOUT_S,
+                hedge=True,
+                model="gpt-4-turbo",
+                response_format={"type": "json_object"},
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7
+            )
+        except Exception as e:
+            print(f"LLM selection failed (try {attempt + 1}/{max_gpt_retries}): {e}")
+            continue
         raw_content = response.choices[0].message.content.strip()
         parsed, ok = safe_json_parse(raw_content)
 
-        if ok:  # ✅ got clean JSON – enrich & return
+        if ok and _is_selection_block(parsed):  # ✅ got clean JSON – enrich & return
             return extract_selected_items(pool, parsed)
 
-        print(f"Bad JSON (try {attempt + 1}/{max_gpt_retries}).  Retrying…")
-
-        # All GPT attempts failed – fall back to local builder so code never crashes
-    return [parsed, False]
+        print(f"Bad JSON or wrong shape (try {attempt + 1}/{max_gpt_retries}).  Retrying…")
 
     # All GPT attempts failed – fall back to local builder so code never crashes
+    return local_select_loadout(pool, role)
+
+
+def _build_batch_selection_prompt(requests):
+    """One prompt covering every pair in `requests` ({key: (pool, role)}); rules are sent once."""
+    sections = []
+    for key, (pool, role) in requests.items():
+        sections.append(f"""
+    Pair: {key}
+    Role: {role}
+    Pool: {json.dumps(pool, separators=(",", ":"))}
+    Primaries: {[g['name'] for g in pool['primaries']]}
+    Secondaries: {[g['name'] for g in pool['secondaries']]}
+    Grenades: {[g['name'] for g in pool['grenades']]}
+    Armor Passives: {[g['name'] for g in pool['armor_passives']]}
+    Stratagems: {[g['name'] for g in pool['stratagems']]}
+    """)
+
+    return f"""
+    You are selecting Helldivers 2 loadouts for several role/enemy pairs at once.
+    Each pair below has its own role and its own filtered pool; build each pair only from its own pool.
+    Roles:
+        - Crowd Control: Focus on stuns, slowing effects, area denial, and killing swarms.
+        - Anti-Tank: Specializes in elite and heavily armored enemies; uses high-penetration or heavy explosives.
+        - Saboteur: Excels at destroying enemy structures, nests, and defenses; focuses on demolition tools and precision explosives.
+        - Stratagem Support: Provides versatile battlefield control with sentries, orbitals, shields, and utilities (not pure DPS).
+
+    Rules (apply to every pair):
+        - Always select 1 Primary, 1 Secondary, 1 Grenade, 1 Armor Passive.
+        - Always select exactly 4 Stratagems.
+          - Exactly 1 Support Weapon (unless it is marked "is_disposable": true, e.g., EAT-17).
+          - Disposable stratagems (marked "is_disposable": true) do not count toward the Support or Backpack limits.
+          - Max 1 Backpack (unless disposable).
+          - Remaining 3 Stratagems must be non-Support, non-Backpack (Orbital, Sentry, Eagle, Emplacement, Mine, Vehicle).
+          - Avoid duplicates unless no alternatives remain.
+        - Bias toward items whose "Goal", "special_traits", or "squad_role" align with that pair's role.
+        - Within those, prioritize higher "score", but do not pick only the highest scores; ensure variety (include at least one item scoring 7 or lower when possible).
+        - Each pair's stratagem mix must support that pair's role:
+          - **Crowd Control**: Area denial (gas, fire), stuns, or wide-coverage weapons.
+          - **Anti-Tank**: High-penetration, explosive, or anti-armor weapons and support tools.
+          - **Saboteur**: Explosives for structures, hives, and defenses (Orbital artillery, Hellbomb, Thermite).
+          - **Stratagem Support**: Versatile utilities (sentries, orbitals, shields) to help the team, not just DPS.
+        - Always pull names only from that pair's pool. Do not invent gear or stratagems.
+        - Do NOT add lore, explanations, or descriptions — only return the JSON.
+
+    Pairs:
+    {"".join(sections)}
+
+    Respond ONLY with a JSON object with one entry per pair key under "builds" (no explanations):
+    {{
+  "builds": {{
+    "<pair key>": {{
+      "loadout": {{
+        "primary": {{"name": "..."}},
+        "secondary": {{"name": "..."}},
+        "grenade": {{"name": "..."}},
+        "armor_passive": {{"name": "..."}}
+      }},
+      "stratagems": [{{"name": "..."}}, {{"name": "..."}}, {{"name": "..."}}, {{"name": "..."}}]
+    }}
+  }}
+    }}
+    """
+
+
+def _is_selection_block(block) -> bool:
+    """Shape check for a selection answer (a single response, or one pair's block in a batch)."""
+    if not isinstance(block, dict):
+        return False
+    gear, strats = block.get("loadout"), block.get("stratagems")
+    if not isinstance(gear, dict) or not isinstance(strats, list):
+        return False
+    return (all(isinstance(gear.get(slot), dict) and gear[slot].get("name")
+                for slot in ("primary", "secondary", "grenade", "armor_passive"))
+            and all(isinstance(s, dict) and s.get("name") for s in strats))
+
+
+def generate_helldivers_loadouts_batch(requests, max_gpt_retries=2):
+    """
+    Selects builds for several pairs in one completion. `requests` maps a pair
+    key to (pool, role). Returns {key: selection} for the pairs whose block came
+    back well-formed; pairs that are missing (or everything, if the call fails)
+    are left for the caller to select one at a time.
+    """
+    if not requests:
+        return {}
+    prompt = _build_batch_selection_prompt(requests)
+
+    for attempt in range(max_gpt_retries):
+        if breaker.is_open():
+            break
+        try:
+            response = _chat_completion(
+                BATCH_SELECTION_TIMEOUT_S,
+                track_latency=False,
+                model="gpt-4-turbo",
+                response_format={"type": "json_object"},
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7
+            )
+        except Exception as e:
+            print(f"LLM batch selection failed (try {attempt + 1}/{max_gpt_retries}): {e}")
+            continue
+        parsed, ok = safe_json_parse(response.choices[0].message.content.strip())
+        builds = parsed.get("builds") if ok and isinstance(parsed, dict) else None
+        if not isinstance(builds, dict):
+            print(f"Bad batch JSON (try {attempt + 1}/{max_gpt_retries}).  Retrying…")
+            continue
 
+        selections = {key: extract_selected_items(pool, builds[key])
+                      for key, (pool, _) in requests.items() if _is_selection_block(builds.get(key))}
+        _count("batch_calls")
+        _count("batch_pairs", len(requests))
+        _count("batch_pairs_missing", len(requests) - len(selections))
+        return selections
+
+    return {}
+
+
+def local_select_loadout(pool, role=None):
+    """
+    LLM-free selection used while the upstream is failing: score-weighted picks,
+    biased toward items whose goal / squad_role mention the role.
+    validate_stratagems still runs afterwards, so this only needs to be close.
+    """
+    _count("local_selections")
+    role_key = (role or "").lower()
+
+    def pick(items, match_field, count=1):
+        matches = [i for i in items if role_key and role_key in i.get(match_field, "").lower()]
+        return weighted_choice(list(matches or items), count)
+
+    final_json = {"loadout": {}, "stratagems": []}
+    for gear_key, category_name in [
+        ("primary", "primaries"),
+        ("secondary", "secondaries"),
+        ("grenade", "grenades"),
+        ("armor_passive", "armor_passives")
+    ]:
+        picked = pick(pool[category_name], "goal")
+        if picked:
+            final_json["loadout"][gear_key] = picked[0]
+
+    supports = [s for s in pool["stratagems"]
+                if s.get("category") == "Support Weapons" and not s.get("is_disposable")]
+    others = [s for s in pool["stratagems"]
+              if s.get("category") != "Support Weapons" and not s.get("is_backpack")]
+    final_json["stratagems"] = pick(supports, "squad_role") + pick(others, "squad_role", 3)
+    return final_json
 
 
 def extract_selected_items(pool, selected_json):
@@ -177,11 +687,8 @@ def extract_selected_items(pool, selected_json):
     return final_json
 
 
-def rewrite_flavor_text(validated_loadout, role=None, enemy=None):
-    """
-    Uses GPT to rewrite flavor text (how-to-play, objective, lore, name)
-    for a *fixed* loadout. Gear and stratagems remain unchanged.
-    """
+def _build_flavor_prompt(validated_loadout, role=None, enemy=None):
+    """Builds the flavor-text prompt shared by the blocking and streaming calls."""
 
     gear_json = json.dumps(validated_loadout.get("loadout", {}), indent=2)
     stratagems_json = json.dumps(validated_loadout.get("stratagems", []), indent=2)
@@ -244,18 +751,113 @@ def rewrite_flavor_text(validated_loadout, role=None, enemy=None):
       "loadout_name": "..."
     }}
     """
+    return prompt
+
+
+def rewrite_flavor_text(validated_loadout, role=None, enemy=None):
+    """
+    Uses GPT to rewrite flavor text (how-to-play, objective, lore, name)
+    for a *fixed* loadout. Gear and stratagems remain unchanged.
+    """
+    prompt = _build_flavor_prompt(validated_loadout, role=role, enemy=enemy)
 
-    response = client.chat.completions.create(
-        model="gpt-4-turbo",
-        response_format={"type": "json_object"},
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.85,  # slightly higher to encourage creative names
-        max_tokens=1500
-    )
+    try:
+        response = _chat_completion(
+            FLAVOR_TIMEOUT_S,
+            hedge=True,
+            model="gpt-4-turbo",
+            response_format={"type": "json_object"},
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.85,  # slightly higher to encourage creative names
+            max_tokens=1500
+        )
+    except Exception as e:
+        print(f"LLM flavor pass failed, using template: {e}")
+        return template_flavor_text(validated_loadout, role=role, enemy=enemy)
 
     raw_content = response.choices[0].message.content.strip()
-    selected_json, _ = safe_json_parse(raw_content)
+    selected_json, ok = safe_json_parse(raw_content)
+    if not ok or not isinstance(selected_json, dict):
+        print("LLM flavor pass returned unusable JSON, using template")
+        return template_flavor_text(validated_loadout, role=role, enemy=enemy)
     return selected_json
+
+
+def stream_flavor_text(validated_loadout, role=None, enemy=None, fields=STREAMED_FIELDS):
+    """
+    Streaming twin of `rewrite_flavor_text`.
+    Yields ("token", {"field": ..., "text": ...}) as string values under `fields`
+    arrive, then a single ("flavor", parsed_json) once the completion ends.
+    """
+    prompt = _build_flavor_prompt(validated_loadout, role=role, enemy=enemy)
+
+    extractor = StreamingJsonFields(fields)
+    salvager = JsonSalvager()
+    raw_parts = []
+    try:
+        stream = _chat_completion(
+            FLAVOR_TIMEOUT_S,
+            model="gpt-4-turbo",
+            response_format={"type": "json_object"},
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.85,
+            max_tokens=1500,
+            stream=True
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            raw_parts.append(delta)
+            salvager.feed(delta)
+            for field, text in extractor.feed(delta):
+                yield "token", {"field": field, "text": text}
+    except Exception as e:
+        print(f"LLM flavor stream failed, using template: {e}")
+        if raw_parts:
+            # Tell the client to drop the partial text it already rendered
+            yield "reset", {}
+        raw_parts = [json.dumps(template_flavor_text(validated_loadout, role=role, enemy=enemy))]
+        salvager = JsonSalvager()
+        salvager.feed(raw_parts[0])
+        for field, text in StreamingJsonFields(fields).feed(raw_parts[0]):
+            yield "token", {"field": field, "text": text}
+
+    # The salvager already saw every chunk, so no second pass over the completion
+    selected_json, ok = salvager.result()
+    if not ok:
+        print("⚠️  GPT returned bad JSON that could not be salvaged.")
+    yield "flavor", selected_json
+
+
+def template_flavor_text(validated_loadout, role=None, enemy=None):
+    """Deterministic stand-in for rewrite_flavor_text while the LLM is unavailable."""
+    _count("template_flavors")
+    role = role or "Helldiver"
+    enemy = enemy or "the enemy"
+    gear = validated_loadout.get("loadout", {})
+    strats = [s.get("name", "") for s in validated_loadout.get("stratagems", [])]
+    primary = gear.get("primary", {}).get("name", "your primary")
+    secondary = gear.get("secondary", {}).get("name", "your sidearm")
+    grenade = gear.get("grenade", {}).get("name", "grenades")
+    support = strats[0] if strats else "your support weapon"
+    rest = ", ".join(strats[1:]) or "your remaining stratagems"
+
+    return {
+        "loadout": gear,
+        "stratagems": validated_loadout.get("stratagems", []),
+        "how_to_play": {
+            "solo": f"Lead with the {primary}, fall back to the {secondary} when pressed, and save {grenade} for clustered {enemy}.",
+            "co_op": f"Call in the {support} early and share {rest} with your squad.",
+            "positioning": f"Hold range against {enemy} and rotate before your stratagems are on cooldown.",
+            "combo_flow": f"Open with {rest}, then clean up with the {support}."
+        },
+        "objective": f"Fill the {role} role against {enemy} with a proven, rules-checked kit.",
+        "lore": f"Issued from Super Earth's field reserves while command uplinks were down, this {role} kit has seen every front against {enemy}. Democracy does not wait for a signal.",
+        "loadout_name": f"{role} Field Kit"
+    }
 # Example Usage:
 # Assuming `filtered_pool` is the output from your filtering script:
 # final_loadout = generate_helldivers_loadout(filtered_pool, role="Crowd Control", enemy="Automatons")
@@ -0,0 +1,226 @@
+import heapq
+import math
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+from CacheSync import hold_lock, record_demand, get_demand_counts, load_cache_snapshot
+from utils import _coerce_to_loadout
+
+ROLES = ["Crowd Control", "Anti-Tank", "Saboteur", "Stratagem Support"]
+ENEMIES = ["automatons", "terminids", "illuminate"]
+
+# Global LLM budget (calls per minute) shared by every scheduled refresh.
+LLM_CALLS_PER_MINUTE = float(os.getenv("DROPZONE_LLM_CALLS_PER_MINUTE", "6"))
+# A selection call plus a flavor call; rerolls are charged after the fact.
+CALLS_PER_REFRESH = 2
+# When several pairs are due, up to this many share one batched selection call
+# (costing 1 + n calls instead of 2n). Set to 1 to refresh strictly one at a time.
+BATCH_MAX_PAIRS = int(os.getenv("DROPZONE_BATCH_MAX_PAIRS", "4"))
+# Never refresh the same pair more often than this, however popular it is.
+MIN_REFRESH_INTERVAL_S = float(os.getenv("DROPZONE_MIN_REFRESH_INTERVAL_S", "600"))
+# Pairs still served from the backup file, or flagged stale by a catalog change, count as this stale.
+BACKUP_STALENESS_S = 24 * 3600
+# Cached entries with no updated_at (written before timestamps existed) are of
+# unknown age: eligible, but ranked behind pairs that have no real build.
+UNKNOWN_STALENESS_S = 3600
+DEMAND_HALF_LIFE_S = 900
+TICK_S = 1.0
+
+
+class TokenBucket:
+    """
+    `rate_per_min` tokens per minute, bursting up to `capacity`.
+    `charge` may push the balance negative; the debt is paid off before
+    `try_acquire` succeeds again, which is the scheduler's backpressure.
+    """
+
+    def __init__(self, rate_per_min, capacity=None):
+        self.rate_per_s = rate_per_min / 60.0
+        self.capacity = capacity if capacity is not None else max(rate_per_min, CALLS_PER_REFRESH)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_s)
+        self.updated = now
+
+    def try_acquire(self, n=1) -> bool:
+        with self._lock:
+            self._refill()
+            if self.tokens >= n:
+                self.tokens -= n
+                return True
+            return False
+
+    def charge(self, n):
+        with self._lock:
+            self._refill()
+            self.tokens -= n
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+
+class RefreshScheduler:
+    """
+    Replaces per-request BackgroundTasks refreshes.
+
+    Every tick the pairs are ranked by staleness x (1 + demand), where demand is
+    a decayed count of /generate_loadout requests across all workers. The top
+    pair that is older than MIN_REFRESH_INTERVAL_S is refreshed if the token
+    bucket can pay for it; otherwise nothing is dispatched until it refills.
+    A pair whose refresh saved nothing (failed, or no novel build) is not
+    retried within MIN_REFRESH_INTERVAL_S either.
+    Only one worker (elected through a held file lock) runs the loop.
+    With `batch_refresh_fn`, the top few eligible pairs are refreshed together
+    when the bucket can pay for the batch.
+    """
+
+    def __init__(self, refresh_fn, load_data, bucket=None, track_calls=None,
+                 min_interval_s=MIN_REFRESH_INTERVAL_S, tick_s=TICK_S,
+                 batch_refresh_fn=None, batch_max_pairs=BATCH_MAX_PAIRS):
+        self.refresh_fn = refresh_fn
+        self.batch_refresh_fn = batch_refresh_fn
+        self.batch_max_pairs = batch_max_pairs
+        self.load_data = load_data
+        self.bucket = bucket or TokenBucket(LLM_CALLS_PER_MINUTE)
+        # Context manager factory yielding a dict whose "calls" counts the LLM
+        # requests (hedges included) made inside the block, e.g. track_usage
+        self.track_calls = track_calls
+        self.min_interval_s = min_interval_s
+        self.tick_s = tick_s
+        self.is_leader = False
+        self._demand = {f"{r}_{e}": 0.0 for r in ROLES for e in ENEMIES}
+        self._seen_counts = None
+        self._attempted = {}  # key -> time of the last refresh dispatched for it
+        self._demand_updated = time.monotonic()
+        self._stats = {"refreshes": 0, "batches": 0, "failures": 0, "throttled_ticks": 0, "last_key": None}
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---- demand ----------------------------------------------------------
+
+    @staticmethod
+    def note_demand(role: str, enemy: str):
+        record_demand(f"{role}_{enemy}")
+
+    def _update_demand(self):
+        counts = get_demand_counts()
+        now = time.monotonic()
+        decay = math.pow(0.5, (now - self._demand_updated) / DEMAND_HALF_LIFE_S)
+        self._demand_updated = now
+        seen = self._seen_counts or counts
+        for key in self._demand:
+            self._demand[key] = self._demand[key] * decay + max(0, counts.get(key, 0) - seen.get(key, 0))
+        self._seen_counts = counts
+
+    # ---- ranking ---------------------------------------------------------
+
+    def _staleness(self, cache, key, now):
+        entry = _coerce_to_loadout(cache.get(key))
+        if not entry or entry.get("stale"):
+            return BACKUP_STALENESS_S
+        updated_at = entry.get("updated_at")
+        if not updated_at:
+            return UNKNOWN_STALENESS_S
+        return max(0.0, now - updated_at)
+
+    def ranked_keys(self):
+        """Eligible keys, most urgent first, as (priority, key, staleness_s)."""
+        cache = load_cache_snapshot()
+        now = time.time()
+        heap = []
+        for key, demand in self._demand.items():
+            staleness = self._staleness(cache, key, now)
+            if staleness < self.min_interval_s or now - self._attempted.get(key, 0.0) < self.min_interval_s:
+                continue
+            priority = staleness * (1.0 + demand)
+            heapq.heappush(heap, (-priority, key, staleness))
+        return [(-p, key, staleness) for p, key, staleness in
+                (heapq.heappop(heap) for _ in range(len(heap)))]
+
+    # ---- dispatch --------------------------------------------------------
+
+    def _take_due_keys(self, ranked):
+        """
+        Most urgent keys the bucket can pay for right now: as large a batch as
+        affordable when batching is on, otherwise a single key. [] if throttled.
+        """
+        n = min(len(ranked), self.batch_max_pairs) if self.batch_refresh_fn else 1
+        while n > 1 and not self.bucket.try_acquire(1 + n):
+            n -= 1
+        if n == 1 and not self.bucket.try_acquire(CALLS_PER_REFRESH):
+            return []
+        return [key for _, key, _ in ranked[:n]]
+
+    def run_once(self):
+        """Refreshes the most urgent pair(s) if the budget allows. Returns the top key or None."""
+        self._update_demand()
+        ranked = self.ranked_keys()
+        if not ranked:
+            return None
+        keys = self._take_due_keys(ranked)
+        if not keys:
+            self._stats["throttled_ticks"] += 1
+            return None
+
+        pairs = [tuple(key.rsplit("_", 1)) for key in keys]
+        for key in keys:
+            self._attempted[key] = time.time()
+        cost = 1 + len(keys)  # one selection call (batched or not) plus a flavor call per pair
+        with (self.track_calls() if self.track_calls else nullcontext()) as usage:
+            try:
+                if len(pairs) > 1:
+                    self.batch_refresh_fn(pairs, self.load_data())
+                    self._stats["batches"] += 1
+                else:
+                    self.refresh_fn(*pairs[0], self.load_data())
+                self._stats["refreshes"] += len(pairs)
+            except Exception as e:
+                self._stats["failures"] += 1
+                print(f"[SCHEDULER] Refresh of {', '.join(keys)} failed: {e}")
+        if usage is not None:
+            # Rerolls, retries and hedges cost more than the up-front estimate
+            extra = usage["calls"] - cost
+            if extra > 0:
+                self.bucket.charge(extra)
+        for key in keys:
+            self._demand[key] = 0.0
+        self._stats["last_key"] = keys[0]
+        return keys[0]
+
+    def _loop(self):
+        while not self._stop.is_set():
+            if not self.is_leader:
+                self.is_leader = hold_lock("scheduler")
+            if self.is_leader:
+                self.run_once()
+            self._stop.wait(self.tick_s if self.is_leader else 10 * self.tick_s)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="refresh-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def status(self) -> dict:
+        return {
+            **self._stats,
+            "leader": self.is_leader,
+            "budget_tokens": round(self.bucket.available(), 2),
+            "budget_per_minute": LLM_CALLS_PER_MINUTE,
+            "batch_max_pairs": self.batch_max_pairs if self.batch_refresh_fn else 1,
+            "queue": [{"key": key, "priority": round(p, 1), "staleness_s": round(s)}
+                      for p, key, s in self.ranked_keys()],
+        }
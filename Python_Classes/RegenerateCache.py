@@ -0,0 +1,211 @@
+"""
+Regenerates cached loadouts offline, e.g. after a catalog update.
+
+    python RegenerateCache.py                         # all 12 pairs, 4 at a time
+    python RegenerateCache.py --pairs "Saboteur_automatons,Anti-Tank_terminids"
+    python RegenerateCache.py --roles Saboteur --enemies automatons terminids
+    python RegenerateCache.py --dry-run               # exercise the pipeline with FakeLLM, no writes
+    python RegenerateCache.py --batch 4               # 3 selection calls for 12 pairs instead of 12
+
+Every pair goes through the same pipeline as a background refresh
+(build_refreshed_loadout). Pairs share one working copy of the cache for the
+over-use rules, so concurrent pairs see each other's picks, and each entry is
+saved as soon as it is ready, while its refresh lease is still held; per-pair
+wall time and LLM token usage are printed at the end.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import contextvars
+
+ROLES = ["Crowd Control", "Anti-Tank", "Saboteur", "Stratagem Support"]
+ENEMIES = ["automatons", "terminids", "illuminate"]
+DATA_FILE = "../json/helldivers_complete.json"
+
+
+def select_pairs(args):
+    if args.pairs:
+        pairs = []
+        for key in args.pairs.split(","):
+            role, _, enemy = key.strip().rpartition("_")
+            if role not in ROLES or enemy not in ENEMIES:
+                raise SystemExit(f"Unknown pair: {key!r} (expected Role_enemy, e.g. Saboteur_automatons)")
+            pairs.append((role, enemy))
+        return pairs
+    roles = args.roles or ROLES
+    enemies = args.enemies or ENEMIES
+    for name in roles:
+        if name not in ROLES:
+            raise SystemExit(f"Unknown role: {name!r}")
+    for name in enemies:
+        if name not in ENEMIES:
+            raise SystemExit(f"Unknown enemy: {name!r}")
+    return [(role, enemy) for role in roles for enemy in enemies]
+
+
+def _save(entries, helldivers_data, save):
+    """Saves `entries` unless this is a dry run; returns the keys that were written."""
+    from ClassPicker import save_refreshed_loadouts
+
+    if not save or not entries:
+        return set()
+    return set(save_refreshed_loadouts(entries, helldivers_data))
+
+
+def regenerate_pair(role, enemy, helldivers_data, cache, cache_lock, save):
+    from ClassPicker import build_refreshed_loadout
+    from CacheSync import refresh_lease
+    from OpenAIRequest import track_usage
+
+    key = f"{role}_{enemy}"
+    started = time.perf_counter()
+    with refresh_lease(key) as acquired:
+        if not acquired:
+            return key, None, {"status": "skipped (refresh in progress elsewhere)",
+                               "seconds": 0.0, "calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        with track_usage() as usage:
+            try:
+                entry = build_refreshed_loadout(role, enemy, helldivers_data, cache, cache_lock=cache_lock)
+                status = "ok"
+            except Exception as e:
+                entry, status = None, f"failed: {e}"
+        # None: no novel build, the current entry is kept
+        if status == "ok" and (entry is None or save and not _save({key: entry}, helldivers_data, save)):
+            entry, status = None, "not saved"
+    return key, entry, {"status": status, "seconds": round(time.perf_counter() - started, 2), **usage}
+
+
+def regenerate_batch(pairs, helldivers_data, cache, cache_lock, save):
+    """
+    One batched selection for `pairs`. Rows report the batch's wall time and its
+    calls/tokens split evenly across the pairs, since the selection call is shared.
+    """
+    from ClassPicker import build_refreshed_loadouts
+    from CacheSync import refresh_lease
+    from OpenAIRequest import track_usage
+    from contextlib import ExitStack
+
+    started = time.perf_counter()
+    rows, leased = {}, []
+    with ExitStack() as stack:
+        for role, enemy in pairs:
+            key = f"{role}_{enemy}"
+            if stack.enter_context(refresh_lease(key)):
+                leased.append((role, enemy))
+            else:
+                rows[key] = {"status": "skipped (refresh in progress elsewhere)",
+                             "seconds": 0.0, "calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        entries = {}
+        with track_usage() as usage:
+            try:
+                if leased:
+                    entries = build_refreshed_loadouts(leased, helldivers_data, cache, cache_lock=cache_lock)
+                status = "ok"
+            except Exception as e:
+                status = f"failed: {e}"
+        saved = _save(entries, helldivers_data, save)
+
+    seconds = round(time.perf_counter() - started, 2)
+    for i, (role, enemy) in enumerate(leased):
+        key = f"{role}_{enemy}"
+        share = {k: usage[k] // len(leased) + (1 if i < usage[k] % len(leased) else 0) for k in usage}
+        pair_status = status
+        if status == "ok" and (key not in entries or (save and key not in saved)):
+            pair_status = "not saved"
+            entries.pop(key, None)
+        rows[key] = {"status": pair_status, "seconds": seconds, **share}
+    return [(key, entries.get(key), row) for key, row in rows.items()]
+
+
+def print_report(report, dry_run, batch=1):
+    print(f"\n{'pair':<32} {'status':<10} {'time_s':>7} {'calls':>6} {'prompt_tok':>11} {'compl_tok':>10}")
+    totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    for key, row in report.items():
+        status = row["status"] if len(row["status"]) <= 10 else row["status"][:9] + "…"
+        print(f"{key:<32} {status:<10} {row['seconds']:>7.2f} {row['calls']:>6} "
+              f"{row['prompt_tokens']:>11} {row['completion_tokens']:>10}")
+        for k in totals:
+            totals[k] += row[k]
+    print(f"{'TOTAL':<32} {'':<10} {'':>7} {totals['calls']:>6} "
+          f"{totals['prompt_tokens']:>11} {totals['completion_tokens']:>10}")
+    if batch > 1:
+        print(f"\nBatched ({batch} pairs per selection call): time and usage are per batch, split across its pairs.")
+    if dry_run:
+        print("\nDry run: cache not written.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regenerate cached loadouts in bulk.")
+    parser.add_argument("--pairs", help="Comma-separated Role_enemy keys")
+    parser.add_argument("--roles", nargs="+", help=f"Subset of {ROLES}")
+    parser.add_argument("--enemies", nargs="+", help=f"Subset of {ENEMIES}")
+    parser.add_argument("--concurrency", type=int, default=4, help="Pairs in flight at once (default %(default)s)")
+    parser.add_argument("--batch", type=int, default=1,
+                        help="Pairs per batched selection call (default %(default)s = one call per pair)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Run the pipeline with FakeLLM (implies --fake-llm, no tokens spent) "
+                             "and do not write the cache")
+    parser.add_argument("--fake-llm", action="store_true", help="Use FakeLLM instead of the OpenAI API")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="FakeLLM latency per call (s)")
+    parser.add_argument("--report", help="Also write the per-pair report as JSON here")
+    args = parser.parse_args()
+
+    pairs = select_pairs(args)
+    if args.dry_run:
+        args.fake_llm = True  # a dry run must not spend real tokens
+    if args.fake_llm:
+        import FakeLLM
+        FakeLLM.install(latency_s=args.llm_latency)
+
+    from CacheSync import load_cache_snapshot
+    from CatalogStore import load_catalog_file
+
+    helldivers_data = load_catalog_file(DATA_FILE)
+    # Working copy for the over-use rules; each finished pick is written back into it
+    cache, cache_lock = dict(load_cache_snapshot()), threading.Lock()
+    save = not args.dry_run
+
+    print(f"Regenerating {len(pairs)} pair(s) with concurrency {args.concurrency}"
+          f"{f', {args.batch} per batch' if args.batch > 1 else ''}"
+          f"{' (fake LLM)' if args.fake_llm else ''}…")
+    results, report = {}, {}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+        if args.batch > 1:
+            futures = [executor.submit(contextvars.copy_context().run, regenerate_batch,
+                                       pairs[i:i + args.batch], helldivers_data, cache, cache_lock, save)
+                       for i in range(0, len(pairs), args.batch)]
+        else:
+            futures = [executor.submit(contextvars.copy_context().run,
+                                       lambda r=role, e=enemy: [regenerate_pair(r, e, helldivers_data, cache,
+                                                                                cache_lock, save)])
+                       for role, enemy in pairs]
+        for future in as_completed(futures):
+            for key, entry, row in future.result():
+                report[key] = row
+                print(f"  {key}: {row['status']} in {row['seconds']}s")
+                if entry:
+                    results[key] = entry
+    elapsed = time.perf_counter() - started
+
+    report = {f"{r}_{e}": report[f"{r}_{e}"] for r, e in pairs}
+    if results and save:
+        print(f"\nWrote {len(results)} entr{'y' if len(results) == 1 else 'ies'} to the cache.")
+
+    print_report(report, args.dry_run, args.batch)
+    print(f"Wall time: {elapsed:.2f}s")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"elapsed_s": round(elapsed, 2), "dry_run": args.dry_run, "batch": args.batch,
+                       "pairs": report}, f, indent=2)
+
+    if any(row["status"].startswith("failed") for row in report.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Fuzz test and benchmark for the JSON salvage in OpenAIRequest.
+
+    python SalvageFuzz.py                      # 20k randomized cases, then the benchmark
+    python SalvageFuzz.py --cases 5000 --seed 7
+    python SalvageFuzz.py --bench-only --sizes 500 2000 8000
+    python SalvageFuzz.py --check              # quick regression gate: new vs old parser, fixed cases
+
+Fuzz cases wrap random JSON (strings full of braces, brackets, quotes and
+escapes) in prose or code fences, feed it whole and in random chunks,
+truncate it, put a malformed block or a bare array in front of it, and wrap
+it in an array. Each case checks safe_json_parse and JsonSalvager against
+the object that was embedded. Exits 1 if any case fails.
+
+The benchmark times the pre-JsonSalvager salvage loop against the current
+one on adversarial output: prose followed by an object whose string value is
+full of unbalanced braces ('prose {"lore": "} {} {..."}').
+
+--check runs a fixed set of cases (seed 0, CHECK_CASES) that the old loop
+handled correctly, i.e. no braces or brackets inside strings and no malformed
+block in front, and exits 1 if the new parser's answer differs from the old
+one's on any of them.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import sys
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "fake-llm")  # OpenAIRequest refuses to import without one
+from OpenAIRequest import safe_json_parse, JsonSalvager
+
+_NASTY = ['{', '}', '[', ']', '"', '\\', ':', ',', '\n', '\t', '} {', '{"x": 1}', '```', 'é', '🪖', ' ']
+_PLAIN = [':', ',', ' ', 'é', '"', '\\', '\n']
+CHECK_CASES = 2000
+_PROSE = ["Sure! Here is the loadout:", "Notes [see below]:", 'I picked "the best" items.',
+          "Done.", "Let me know if you need changes", "Output:", ""]
+
+
+def random_string(rng, specials=_NASTY):
+    return "".join(rng.choice(specials) if rng.random() < 0.4 else rng.choice("abcdefgh ")
+                   for _ in range(rng.randint(0, 12)))
+
+
+def random_value(rng, depth=0, specials=_NASTY):
+    kind = rng.random()
+    if depth > 3 or kind < 0.35:
+        return rng.choice([random_string(rng, specials), rng.randint(-1000, 1000), rng.random(),
+                           True, False, None])
+    if kind < 0.55:
+        return [random_value(rng, depth + 1, specials) for _ in range(rng.randint(0, 4))]
+    return random_object(rng, depth + 1, specials)
+
+
+def random_object(rng, depth=0, specials=_NASTY):
+    return {random_string(rng, specials) or "k": random_value(rng, depth, specials)
+            for _ in range(rng.randint(1, 5))}
+
+
+def dumps(rng, value):
+    return json.dumps(value, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 2]))
+
+
+def wrap(rng, body):
+    if rng.random() < 0.3:
+        return f"```{rng.choice(['json', ''])}\n{body}\n```"
+    return f"{rng.choice(_PROSE)} {body} {rng.choice(_PROSE)}"
+
+
+def feed_chunked(rng, text):
+    salvager = JsonSalvager()
+    i = 0
+    while i < len(text):
+        step = rng.randint(1, 40)
+        salvager.feed(text[i:i + step])
+        i += step
+    return salvager.result()
+
+
+def make_case(rng, specials=_NASTY, kinds=("prose", "malformed_first", "array_first", "in_array", "truncated")):
+    """(name, text, expected) where expected is the object, or None if nothing should be found."""
+    obj = random_object(rng, specials=specials)
+    body = dumps(rng, obj)
+    kind = rng.choice(kinds)
+    if kind == "malformed_first":
+        return kind, wrap(rng, '{"loadout": oops} ' + body), obj
+    if kind == "array_first":
+        return kind, wrap(rng, "[1, 2] " + body), obj
+    if kind == "in_array":
+        # Prose around it, or the fast path would return the whole array
+        return kind, f"Result: [{body}, 3] done", obj
+    if kind == "truncated":
+        return kind, f"{rng.choice(_PROSE)} {body[:rng.randint(1, len(body) - 1)]}", None
+    return kind, wrap(rng, body), obj
+
+
+def check(name, text, expected, got):
+    data, ok = got
+    if expected is None:
+        return not ok or f"{name}: expected nothing, got {data!r}"
+    return (ok and data == expected) or f"{name}: expected {expected!r}, got {data!r} (ok={ok})"
+
+
+def fuzz(cases, seed):
+    rng = random.Random(seed)
+    failures, by_kind = [], {}
+    with contextlib.redirect_stdout(io.StringIO()):  # safe_json_parse warns on every miss
+        for _ in range(cases):
+            name, text, expected = make_case(rng)
+            by_kind[name] = by_kind.get(name, 0) + 1
+            for how, got in (("whole", safe_json_parse(text)), ("chunked", feed_chunked(rng, text))):
+                result = check(f"{name}/{how}", text, expected, got)
+                if result is not True:
+                    failures.append((result, text))
+    print(f"Fuzz: {cases} cases (seed {seed}), {', '.join(f'{k}={v}' for k, v in sorted(by_kind.items()))}")
+    for message, text in failures[:5]:
+        print(f"  FAIL {message}\n       input: {text!r}")
+    print(f"  {len(failures)} failure(s)")
+    return not failures
+
+
+def check_against_baseline(cases=CHECK_CASES, seed=0):
+    """Cases the old loop got right (no structure inside strings): old and new must agree."""
+    rng = random.Random(seed)
+    mismatches = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(cases):
+            # The old loop never recovered from a malformed block, so that kind is left out
+            name, text, _ = make_case(rng, _PLAIN, ("prose", "array_first", "in_array"))
+            old = baseline_salvage(text)
+            for how, new in (("whole", safe_json_parse(text)), ("chunked", feed_chunked(rng, text))):
+                if new != old:
+                    mismatches.append((f"{name}/{how}: old {old!r}, new {new!r}", text))
+    print(f"Check: {cases} cases (seed {seed}) against the old salvage loop, {len(mismatches)} mismatch(es)")
+    for message, text in mismatches[:5]:
+        print(f"  MISMATCH {message}\n           input: {text!r}")
+    return not mismatches
+
+
+# -------------------- Benchmark --------------------
+
+def baseline_salvage(raw: str):
+    """The salvage loop safe_json_parse used before JsonSalvager (kept for comparison)."""
+    cleaned = raw.strip()
+    if cleaned.startswith("```"):
+        cleaned = re.sub(r"^```[a-zA-Z0-9]*\n?", "", cleaned)
+        cleaned = cleaned.rstrip("`")
+    try:
+        return json.loads(cleaned), True
+    except json.JSONDecodeError:
+        pass
+    for open_char, close_char in (("{", "}"), ("[", "]")):
+        start = cleaned.find(open_char)
+        if start == -1:
+            continue
+        depth = 0
+        for idx, ch in enumerate(cleaned[start:], start=start):
+            if ch == open_char:
+                depth += 1
+            elif ch == close_char:
+                depth -= 1
+                if depth == 0:
+                    try:
+                        return json.loads(cleaned[start:idx + 1]), True
+                    except json.JSONDecodeError:
+                        continue
+    return {}, False
+
+
+def adversarial(n):
+    return 'Here is your loadout: {"lore": "' + "} {" * n + '", "loadout_name": "Iron Talon"} thanks'
+
+
+def best_ms(fn, text, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def bench(sizes, repeats):
+    print(f"\nBenchmark (best of {repeats}): prose + object whose string holds n unbalanced '}} {{'")
+    print(f"{'n':>7} {'baseline_ms':>12} {'salvager_ms':>12} {'speedup':>8}")
+    for n in sizes:
+        text = adversarial(n)
+        assert safe_json_parse(text)[1], "salvager missed the object"
+        old, new = best_ms(baseline_salvage, text, repeats), best_ms(safe_json_parse, text, repeats)
+        print(f"{n:>7} {old:>12.2f} {new:>12.2f} {old / new:>7.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuzz and benchmark the JSON salvage.")
+    parser.add_argument("--cases", type=int, default=20000, help="Randomized fuzz cases (default %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 2000, 8000],
+                        help="Adversarial input sizes for the benchmark (default %(default)s)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--bench-only", action="store_true")
+    parser.add_argument("--check", action="store_true",
+                        help=f"Only compare against the old parser on {CHECK_CASES} fixed cases; exit 1 on any mismatch")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check_against_baseline() else 1)
+    ok = True
+    if not args.bench_only:
+        ok = fuzz(args.cases, args.seed)
+    bench(args.sizes, args.repeats)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
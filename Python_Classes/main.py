@@ -1,29 +1,78 @@
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, BackgroundTasks, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
 import json
 import os
 
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from typing import Optional
 from utils import (
     load_json, choose_role,
     choose_faction
 )
-from ClassPicker import update_cached_loadout
+from ClassPicker import (
+    update_cached_loadout, update_cached_loadouts, stream_loadout, get_reroll_metrics, invalidate_loadouts,
+    set_catalog_provider, set_budget_charger,
+)
+from CacheSync import load_cache_snapshot
+from OpenAIRequest import get_llm_metrics, track_usage
+from RefreshScheduler import RefreshScheduler
+from CatalogStore import CatalogStore
 
 CACHE_FILE = "../json/helldivers_cached_loadouts.json"
 DATA_FILE = "../json/helldivers_complete.json"
 BACKUP_FILE = "../json/Helldivers_Backup_Classes.json"
 ROLES = ["Crowd Control", "Anti-Tank", "Saboteur", "Stratagem Support"]
 ENEMIES = ["automatons", "terminids", "illuminate"]
+# Opt-in: DROPZONE_SCHEDULER=1 replaces the background refresh per /generate_loadout call
+# with the budgeted refresh scheduler.
+SCHEDULER_ENABLED = os.getenv("DROPZONE_SCHEDULER", "0") == "1"
+
+
+# Parsed and indexed once per file change, not per request; edits to the file are picked up live.
+catalog_store = CatalogStore(
+    DATA_FILE,
+    on_change=lambda old, new, changed: invalidate_loadouts(changed),
+)
+# Refreshes that started on an older catalog are checked against this one before saving
+set_catalog_provider(catalog_store.current)
+
+
+def load_catalog():
+    """The current catalog snapshot; hold on to it for the whole request."""
+    return catalog_store.current()
+
+
+scheduler = RefreshScheduler(
+    update_cached_loadout,
+    load_catalog,
+    track_calls=track_usage,
+    batch_refresh_fn=update_cached_loadouts,
+)
+# /stream_loadout generations are paid for from the same budget
+set_budget_charger(scheduler.bucket.charge)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    catalog_store.start()
+    if SCHEDULER_ENABLED and load_catalog() is not None:
+        scheduler.start()
+    yield
+    scheduler.stop()
+    catalog_store.stop()
 
-app = FastAPI()
 
+app = FastAPI(lifespan=lifespan)
 
-app.mount("/static", StaticFiles(directory="../static"), name="static")
-app.mount("/icons", StaticFiles(directory="../icons"), name="icons")
+
+# The UI assets are optional (the backend can run on its own, e.g. under the load tester)
+if os.path.isdir("../static"):
+    app.mount("/static", StaticFiles(directory="../static"), name="static")
+if os.path.isdir("../icons"):
+    app.mount("/icons", StaticFiles(directory="../icons"), name="icons")
 
 app.add_middleware(
     CORSMiddleware,
@@ -62,8 +111,8 @@ def extract_valid(entry):
 def get_loadout(role: str, enemy: str):
     key = f"{role}_{enemy}"
 
-    # 1) Check cache
-    cache = load_json(CACHE_FILE)
+    # 1) Check cache (in-memory copy, re-read only when a worker published a new version)
+    cache = load_cache_snapshot()
     loadout = extract_valid(cache.get(key))
     if loadout:
         return loadout
@@ -94,10 +143,13 @@ def generate_loadout(request: LoadoutRequest, background_tasks: BackgroundTasks)
     }
 
     # Schedule background update
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            helldivers_data = json.load(f)
-        background_tasks.add_task(update_cached_loadout, role, enemy, helldivers_data)
+    if SCHEDULER_ENABLED:
+        # Demand only raises the pair's priority; the scheduler decides when to spend LLM budget
+        scheduler.note_demand(role, enemy)
+    else:
+        catalog = load_catalog()
+        if catalog is not None:
+            background_tasks.add_task(update_cached_loadout, role, enemy, catalog)
 
     return response
 
@@ -106,3 +158,52 @@ def generate_loadout(request: LoadoutRequest, background_tasks: BackgroundTasks)
 def get_cached_loadout(role: str, enemy: str):
     loadout = get_loadout(role, enemy)
     return {"role": role, "enemy": enemy, **loadout}
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Per-worker counters for the refresh pipeline."""
+    return {
+        "rerolls": get_reroll_metrics(),
+        "llm": get_llm_metrics(),
+        "scheduler": scheduler.status(),
+        "catalog": catalog_store.status(),
+    }
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.get("/stream_loadout")
+def stream_new_loadout(role: Optional[str] = None, enemy: Optional[str] = None):
+    """
+    Generates a brand-new build right now and streams it as Server-Sent Events:
+    started -> gear_locked (provisional) -> gear_locked -> stratagems_validated -> token* -> done.
+    """
+    role = role or choose_role()
+    enemy = enemy or choose_faction()
+    # The pair becomes a cache key and a history key, so only known pairs may be generated
+    if role not in ROLES or enemy not in ENEMIES:
+        raise HTTPException(status_code=422, detail=f"role must be one of {ROLES}, enemy one of {ENEMIES}")
+
+    def events():
+        # First byte goes out before any LLM work starts
+        yield _sse("started", {"role": role, "enemy": enemy})
+        helldivers_data = load_catalog()
+        if helldivers_data is None:
+            yield _sse("error", {"detail": "Item catalog not found"})
+            return
+        try:
+            for event, data in stream_loadout(role, enemy, helldivers_data):
+                if event == "done":
+                    data = {"role": role, "enemy": enemy, **data}
+                yield _sse(event, data)
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -17,8 +17,8 @@ def load_json(file_path: str):
     return {}
 
 def save_cache(cache):
-    with open(CACHE_FILE, "w", encoding="utf-8") as f:
-        json.dump(cache, f, indent=2)
+    from CacheSync import save_cache_all  # CacheSync imports utils
+    save_cache_all(cache)
 
 def build_initial_cache():
     """Creates 12 placeholder loadouts if no cache exists yet."""
@@ -110,6 +110,28 @@ def _coerce_to_loadout(obj):
                 return item
     return {}
 
+is_support = lambda s: s["category"] == "Support Weapons" and not s.get("is_disposable", False)
+is_backpack = lambda s: s.get("is_backpack", False) and not s.get("is_disposable", False)
+
+def check_loadout_needs_fix(loadout):
+    strats = loadout.get("stratagems", [])
+    names = [s["name"] for s in strats]
+    duplicate = len(names) != len(set(names))
+
+    support_cnt = sum(1 for s in strats if is_support(s))
+    backpack_cnt = sum(1 for s in strats if is_backpack(s))
+    four_strats  = len(strats) == 4
+
+    # Hazard‑armor logic unchanged -------------
+    items = list(loadout["loadout"].values()) + strats
+    dmg_types = [i.get("Damage Type") for i in items if i.get("Damage Type")]
+    counts = Counter(dmg_types)
+    hazard = next((d for d, c in counts.items() if d in ["Toxic Gas", "Fire", "ARC"] and c >= 2), None)
+    armor_type = loadout["loadout"].get("armor_passive", {}).get("Damage Type")
+    armor_bad  = (hazard and armor_type != hazard) or (not hazard and armor_type in ["Toxic Gas", "Fire", "ARC"])
+
+    return duplicate or support_cnt != 1 or backpack_cnt > 1 or not four_strats or armor_bad
+
 def calculate_weight(score):
     return max(0.5, score ** 1.2)
 